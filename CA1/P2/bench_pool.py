@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+import time
+
+import paramiko
+
+import local_ssh_server
+import ssh_client
+from ssh_pool import POOL
+
+OLD_HEALTH_COMMANDS = [
+    "cat /proc/loadavg | awk '{print $1}'",
+    "free | grep Mem | awk '{print $3/$2 * 100.0}'",
+    "df -h / | tail -1 | awk '{print $5}' | tr -d '%'",
+]
+
+
+def fresh_client(port, key_path):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect("127.0.0.1", port=port, username="bench", key_filename=key_path)
+    return client
+
+
+def run(client, command):
+    _, stdout, _ = client.exec_command(command)
+    return stdout.read()
+
+
+def timed(label, repeat, func):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    per_call = (time.perf_counter() - start) / repeat * 1000
+    print(f"{label:<44} {per_call:8.1f} ms")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-command latency with and without the SSH pool.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    key = paramiko.RSAKey.generate(2048)
+    key_path = os.path.join(tempfile.mkdtemp(), "id_rsa")
+    key.write_private_key_file(key_path)
+    port = local_ssh_server.start_local_server(key)
+
+    def pooled():
+        client = POOL.get("127.0.0.1", "bench", key_path, port)
+        POOL.release(client)
+        return client
+
+    def fresh_command():
+        client = fresh_client(port, key_path)
+        run(client, "true")
+        client.close()
+
+    def fresh_sftp():
+        sftp = pooled().open_sftp()
+        sftp.stat("/")
+        sftp.close()
+
+    print(f"local stand-in server, {args.repeat} repetitions each\n")
+    before = timed("command, new connection each time", args.repeat, fresh_command)
+    after = timed("command, pooled connection", args.repeat, lambda: run(pooled(), "true"))
+    print(f"{'':<44} {before / after:8.1f}x\n")
+    before = timed("health, three exec_command round trips", args.repeat,
+                   lambda: [run(pooled(), command) for command in OLD_HEALTH_COMMANDS])
+    after = timed("health, one exec_command", args.repeat, lambda: run(pooled(), ssh_client.HEALTH_COMMAND))
+    print(f"{'':<44} {before / after:8.1f}x\n")
+    before = timed("SFTP stat, new session each time", args.repeat, fresh_sftp)
+    after = timed("SFTP stat, reused session", args.repeat, lambda: POOL.open_sftp(pooled()).stat("/"))
+    print(f"{'':<44} {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
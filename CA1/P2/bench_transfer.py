@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+
+import paramiko
+
+import local_ssh_server
+import sftp_transfer
+from ssh_pool import POOL
+
+
+def timed(label, size, func):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print(f"{label:<46} {seconds:7.2f}s {size / seconds / 1e6 if seconds else 0:8.1f} MB/s")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sftp_transfer with plain sftp.put/get against a local SSH server.")
+    parser.add_argument("--size", type=int, default=128, help="test file size in MB")
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 16, sftp_transfer.PARALLEL_REQUESTS])
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    key_path = os.path.join(work, "id_rsa")
+    key = paramiko.RSAKey.generate(2048)
+    key.write_private_key_file(key_path)
+    source = os.path.join(work, "source.bin")
+    with open(source, "wb") as f:
+        for _ in range(args.size):
+            f.write(os.urandom(1024 * 1024))
+    size = args.size * 1024 * 1024
+    remote = os.path.join(work, "remote.bin")
+    local = os.path.join(work, "local.bin")
+
+    port = local_ssh_server.start_local_server(key)
+    client = POOL.get("127.0.0.1", "bench", key_path, port)
+    sftp = POOL.open_sftp(client)
+
+    print(f"{args.size} MB file, local stand-in server\n")
+    timed("sftp.put", size, lambda: sftp.put(source, remote))
+    os.remove(remote)
+    timed("sftp_transfer.upload (pipelined)", size, lambda: sftp_transfer.upload(client, sftp, source, remote))
+    timed("sftp_transfer.upload again (size-mtime skip)", size,
+          lambda: sftp_transfer.upload(client, sftp, source, remote))
+    timed("sftp_transfer.upload again (checksum skip)", size,
+          lambda: sftp_transfer.upload(client, sftp, source, remote, compare="checksum"))
+
+    # an upload cut off halfway leaves a partial file behind
+    os.remove(remote)
+    with open(source, "rb") as src, open(remote + sftp_transfer.PART_SUFFIX, "wb") as part:
+        part.write(src.read(size // 2))
+    timed("sftp_transfer.upload resuming at 50%", size, lambda: sftp_transfer.upload(client, sftp, source, remote))
+    print()
+
+    timed("sftp.get", size, lambda: sftp.get(remote, local))
+    for parallel in args.parallel:
+        os.remove(local)
+        timed(f"sftp_transfer.download, {parallel} requests in flight", size,
+              lambda: sftp_transfer.download(client, sftp, remote, local, parallel=parallel))
+    with open(remote, "rb") as src, open(local + sftp_transfer.PART_SUFFIX, "wb") as part:
+        part.write(src.read(size // 2))
+    os.remove(local)
+    timed("sftp_transfer.download resuming at 50%", size, lambda: sftp_transfer.download(client, sftp, remote, local))
+    with open(source, "rb") as a, open(local, "rb") as b:
+        print(f"\ndownloaded copy identical: {a.read() == b.read()}")
+
+
+if __name__ == "__main__":
+    main()
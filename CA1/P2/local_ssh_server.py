@@ -0,0 +1,168 @@
+import logging
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+# clients that disconnect mid-transfer make the server log every reset
+logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+
+class LocalSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class LocalSFTP(paramiko.SFTPServerInterface):
+    """
+    Serves the local filesystem as-is over SFTP.
+    """
+
+    def _error(self, e):
+        return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return self._error(e)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return self._error(e)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return self._error(e)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "r+b"
+        else:
+            mode = "rb"
+        handle = LocalSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return self._error(e)
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.replace(oldpath, newpath)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return self._error(e)
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return self._error(e)
+
+    def chattr(self, path, attr):
+        try:
+            if attr.st_mtime is not None:
+                os.utime(path, (attr.st_atime, attr.st_mtime))
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return self._error(e)
+
+    def canonicalize(self, path):
+        return os.path.abspath(path)
+
+
+class LocalServer(paramiko.ServerInterface):
+    """
+    Accepts only authorized_key and runs exec requests with the local shell.
+    """
+
+    def __init__(self, authorized_key):
+        self.authorized_key = authorized_key
+
+    def check_auth_publickey(self, username, key):
+        # anyone on this machine can reach the port: only the caller's own key gets a shell
+        return paramiko.AUTH_SUCCESSFUL if key == self.authorized_key else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        # output must not overtake the reply to this request, so start a moment later
+        threading.Timer(0.002, self._run, args=(channel, command)).start()
+        return True
+
+    def _run(self, channel, command):
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def pump(stream, send):
+            for chunk in iter(lambda: stream.read1(32768), b""):
+                send(chunk)
+
+        err = threading.Thread(target=pump, args=(process.stderr, channel.sendall_stderr))
+        err.start()
+        pump(process.stdout, channel.sendall)
+        err.join()
+        channel.send_exit_status(process.wait())
+        channel.close()
+
+
+def start_local_server(client_key, host_key=None):
+    """
+    Runs an SSH and SFTP server for benchmarks and tests on a free localhost port.
+
+    It stands in for sshd where there is none: exec runs on this machine as
+    the calling user and SFTP paths are local paths, so only client_key is
+    accepted; generate one per run and keep its private part to yourself.
+
+    Args:
+        client_key (paramiko.PKey): The one key clients may log in with.
+        host_key (paramiko.PKey, optional): The server's key. Defaults to a new RSA key.
+
+    Returns:
+        int: The port it listens on.
+    """
+    host_key = host_key or paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)
+
+    def serve():
+        while True:
+            conn, _ = listener.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, LocalSFTP)
+            transport.start_server(server=LocalServer(client_key))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener.getsockname()[1]
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import shlex
+import stat
+import time
+
+CHUNK_SIZE = 1024 * 1024
+PARALLEL_REQUESTS = 64
+PART_SUFFIX = ".part"
+# bytes before the resume offset compared on both sides before trusting a partial file
+RESUME_CHECK_BYTES = 64 * 1024
+COMPARE_MODES = ("size-mtime", "checksum", "none")
+
+
+def local_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remote_sha256(client, path):
+    """
+    Returns the sha256 of a remote file computed on the server, or None if sha256sum is not available.
+    """
+    _, stdout, _ = client.exec_command(f"sha256sum -- {shlex.quote(path)}")
+    output = stdout.read().decode().split()
+    return output[0] if stdout.channel.recv_exit_status() == 0 and output else None
+
+
+def remote_stat(sftp, path):
+    try:
+        return sftp.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def local_stat(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def is_identical(client, local_path, remote_path, local_attr, remote_attr, compare):
+    """
+    Tells whether both files already have the same content, by size and mtime or by checksum.
+    """
+    if compare == "none" or local_attr is None or remote_attr is None:
+        return False
+    if local_attr.st_size != remote_attr.st_size:
+        return False
+    if compare == "size-mtime":
+        return int(local_attr.st_mtime) == int(remote_attr.st_mtime)
+    checksum = remote_sha256(client, remote_path)
+    return checksum is not None and checksum == local_sha256(local_path)
+
+
+def tails_match(local_file, remote_file, offset):
+    """
+    Compares the RESUME_CHECK_BYTES before offset in two open files.
+    """
+    start = max(0, offset - RESUME_CHECK_BYTES)
+    local_file.seek(start)
+    remote_file.seek(start)
+    return local_file.read(offset - start) == remote_file.read(offset - start)
+
+
+def report(action, path, size, offset, seconds):
+    sent = size - offset
+    rate = sent / seconds / 1e6 if seconds else 0
+    resumed = f", resumed at {offset} bytes" if offset else ""
+    print(f"{action} {path}: {sent / 1e6:.1f} MB in {seconds:.2f}s ({rate:.1f} MB/s{resumed})")
+    return {"skipped": False, "bytes": sent, "seconds": seconds, "resumed_from": offset}
+
+
+def upload(client, sftp, local_path, remote_path, chunk_size=CHUNK_SIZE, compare="size-mtime", resume=True):
+    """
+    Uploads a file, skipping it if the remote copy is identical and resuming a partial upload.
+
+    Data goes to remote_path + PART_SUFFIX with pipelined writes, so
+    paramiko keeps many write requests in flight instead of waiting for
+    each acknowledgement. The partial file is renamed into place and given
+    the local mtime once complete, which makes the next size-mtime check
+    skip it. An interrupted upload continues from the size of the partial
+    file if the bytes just before that offset match the local file.
+
+    Args:
+        client (paramiko.SSHClient): The SSH client object, used for remote checksums.
+        sftp (paramiko.SFTPClient): An open SFTP session of client.
+        local_path (str): The path to the local file.
+        remote_path (str): The path to save the file on the server.
+        chunk_size (int): Bytes read from the local file per write call.
+        compare (str): How to tell identical files apart, one of COMPARE_MODES.
+        resume (bool): Continue from a partial remote file instead of starting over.
+
+    Returns:
+        dict: "skipped", "bytes" sent, "seconds" and "resumed_from" offset.
+    """
+    local_attr = os.stat(local_path)
+    if is_identical(client, local_path, remote_path, local_attr, remote_stat(sftp, remote_path), compare):
+        print(f"Skipped {remote_path}: already identical")
+        return {"skipped": True, "bytes": 0, "seconds": 0.0, "resumed_from": 0}
+
+    part_path = remote_path + PART_SUFFIX
+    part_attr = remote_stat(sftp, part_path) if resume else None
+    offset = part_attr.st_size if part_attr and part_attr.st_size <= local_attr.st_size else 0
+    start = time.perf_counter()
+    with open(local_path, "rb") as local_file:
+        if offset:
+            with sftp.open(part_path, "rb") as remote_file:
+                if not tails_match(local_file, remote_file, offset):
+                    offset = 0
+        with sftp.open(part_path, "r+b" if offset else "wb") as remote_file:
+            remote_file.set_pipelined(True)
+            remote_file.seek(offset)
+            local_file.seek(offset)
+            for block in iter(lambda: local_file.read(chunk_size), b""):
+                remote_file.write(block)
+    # closing the file waited for every pending write; check nothing was lost
+    if sftp.stat(part_path).st_size != local_attr.st_size:
+        raise IOError(f"size mismatch after upload of {local_path}")
+    sftp.posix_rename(part_path, remote_path)
+    sftp.utime(remote_path, (local_attr.st_atime, local_attr.st_mtime))
+    return report("Uploaded", remote_path, local_attr.st_size, offset, time.perf_counter() - start)
+
+
+def download(client, sftp, remote_path, local_path, parallel=PARALLEL_REQUESTS, compare="size-mtime", resume=True):
+    """
+    Downloads a file, skipping it if the local copy is identical and resuming a partial download.
+
+    The remote file is prefetched with up to parallel read requests in
+    flight into local_path + PART_SUFFIX, which is renamed into place and
+    given the remote mtime once complete. An interrupted download continues
+    from the size of the partial file if the bytes just before that offset
+    match the remote file.
+
+    Args:
+        client (paramiko.SSHClient): The SSH client object, used for remote checksums.
+        sftp (paramiko.SFTPClient): An open SFTP session of client.
+        remote_path (str): The path to the file on the server.
+        local_path (str): The path to save the file locally.
+        parallel (int): Read requests kept in flight.
+        compare (str): How to tell identical files apart, one of COMPARE_MODES.
+        resume (bool): Continue from a partial local file instead of starting over.
+
+    Returns:
+        dict: "skipped", "bytes" received, "seconds" and "resumed_from" offset.
+    """
+    remote_attr = sftp.stat(remote_path)
+    if stat.S_ISDIR(remote_attr.st_mode or 0):
+        raise IsADirectoryError(remote_path)
+    if is_identical(client, local_path, remote_path, local_stat(local_path), remote_attr, compare):
+        print(f"Skipped {local_path}: already identical")
+        return {"skipped": True, "bytes": 0, "seconds": 0.0, "resumed_from": 0}
+
+    part_path = local_path + PART_SUFFIX
+    part_attr = local_stat(part_path) if resume else None
+    offset = part_attr.st_size if part_attr and part_attr.st_size <= remote_attr.st_size else 0
+    start = time.perf_counter()
+    with sftp.open(remote_path, "rb") as remote_file:
+        if offset:
+            with open(part_path, "rb") as local_file:
+                if not tails_match(local_file, remote_file, offset):
+                    offset = 0
+        with open(part_path, "r+b" if offset else "wb") as local_file:
+            local_file.seek(offset)
+            local_file.truncate()
+            remote_file.seek(offset)
+            remote_file.prefetch(remote_attr.st_size, parallel)
+            # one prefetched response per read; larger reads are slower as
+            # paramiko joins the responses into a new bytes object each time
+            for block in iter(lambda: remote_file.read(remote_file.MAX_REQUEST_SIZE), b""):
+                local_file.write(block)
+    if os.path.getsize(part_path) != remote_attr.st_size:
+        raise IOError(f"size mismatch after download of {remote_path}")
+    os.replace(part_path, local_path)
+    os.utime(local_path, (remote_attr.st_atime, remote_attr.st_mtime))
+    return report("Downloaded", local_path, remote_attr.st_size, offset, time.perf_counter() - start)
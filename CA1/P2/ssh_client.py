@@ -1,7 +1,27 @@
-import paramiko
-import psutil
 import os
-import inspect  # Import the inspect module
+import collections
+import concurrent.futures
+import select
+import sys
+import threading
+import time
+from ssh_pool import POOL  # puts instrument.py on the path
+import sftp_transfer
+import instrument
+
+# only imported once a connection is made, so --help does not wait for it
+paramiko = instrument.lazy_import("paramiko")
+
+# loadavg, used memory % and root disk use % in one round trip, one per line
+HEALTH_COMMAND = ("awk '{print $1}' /proc/loadavg; "
+                  "free | awk '/^Mem/ {print $3/$2 * 100.0}'; "
+                  "df -h / | awk 'NR==2 {print $5}' | tr -d '%'")
+READ_CHUNK = 32768
+BATCH_WORKERS = 16
+# lines of each output stream kept per host in batch results
+TAIL_LINES = 20
+# what paramiko's recv_exit_status() returns when the channel closed without an exit status
+NO_EXIT_STATUS = -1
 
 # Define local command handlers
 def get_system_health(client, role):
@@ -17,14 +37,12 @@ def get_system_health(client, role):
         return
 
     try:
-        stdin, stdout, stderr = client.exec_command("cat /proc/loadavg | awk '{print $1}'")
-        cpu_percent = stdout.read().decode().strip()
-        
-        stdin, stdout, stderr = client.exec_command("free | grep Mem | awk '{print $3/$2 * 100.0}'")
-        memory_percent = stdout.read().decode().strip()
-        
-        stdin, stdout, stderr = client.exec_command("df -h / | tail -1 | awk '{print $5}' | tr -d '%'")
-        disk_percent = stdout.read().decode().strip()
+        with instrument.timed("health"):
+            stdin, stdout, stderr = client.exec_command(HEALTH_COMMAND)
+            output = stdout.read()
+        instrument.count("SSH round trips")
+        instrument.count("bytes transferred", len(output))
+        cpu_percent, memory_percent, disk_percent = (output.decode().splitlines() + ["", "", ""])[:3]
 
         print(f"Remote Server Health Status:")
         print(f"CPU Usage: {cpu_percent}%")
@@ -37,6 +55,7 @@ def get_system_health(client, role):
 def upload_file(client, role, local_path, remote_path, username):
     """
     Uploads a file to the remote server using SFTP, restricted to /home/USER/Download for 'user' role.
+    An identical remote file is skipped and an interrupted upload is resumed (see sftp_transfer.upload).
 
     Args:
         client (paramiko.SSHClient): The SSH client object.
@@ -57,10 +76,13 @@ def upload_file(client, role, local_path, remote_path, username):
             return
 
     try:
-        sftp = client.open_sftp()
-        sftp.put(local_path, remote_path)
-        sftp.close()
-        print(f"File uploaded successfully to {remote_path}")
+        sftp = POOL.open_sftp(client)
+        with instrument.timed("upload"):
+            result = sftp_transfer.upload(client, sftp, local_path, remote_path)
+        instrument.count("bytes transferred", result["bytes"])
+        instrument.count("files skipped" if result["skipped"] else "files transferred")
+        if not result["skipped"]:
+            print(f"File uploaded successfully to {remote_path}")
     except Exception as e:
         print(f"File upload failed: {e}. Please check file permissions and path.")
 
@@ -68,6 +90,7 @@ def upload_file(client, role, local_path, remote_path, username):
 def download_file(client, role, local_path, remote_path, username):
     """
     Downloads a file from the remote server using SFTP, restricted to /home/USER/Download for 'user' role.
+    An identical local file is skipped and an interrupted download is resumed (see sftp_transfer.download).
 
     Args:
         client (paramiko.SSHClient): The SSH client object.
@@ -88,10 +111,13 @@ def download_file(client, role, local_path, remote_path, username):
             return
 
     try:
-        sftp = client.open_sftp()
-        sftp.get(remote_path, local_path)
-        sftp.close()
-        print(f"File downloaded successfully to {local_path}")
+        sftp = POOL.open_sftp(client)
+        with instrument.timed("download"):
+            result = sftp_transfer.download(client, sftp, remote_path, local_path)
+        instrument.count("bytes transferred", result["bytes"])
+        instrument.count("files skipped" if result["skipped"] else "files transferred")
+        if not result["skipped"]:
+            print(f"File downloaded successfully to {local_path}")
     except Exception as e:
         print(f"File download failed: {e}")
 
@@ -113,8 +139,9 @@ LOCAL_COMMANDS = {
 
 def ssh_connect(host, username, key_path=None):
     """
-    Establishes an SSH connection to the specified host.
+    Establishes an SSH connection to the specified host, or reuses the pooled one.
     Automatically attempts to find an SSH key in common locations if key_path is None.
+    The connection stays held until it is passed to POOL.release().
 
     Args:
         host (str): The hostname or IP address of the SSH server.
@@ -126,27 +153,8 @@ def ssh_connect(host, username, key_path=None):
         None: If the connection fails.
     """
 
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        if key_path:
-            client.connect(host, username=username, key_filename=key_path)
-        else:
-            # Attempt to find SSH key in default locations
-            default_key_paths = [
-                os.path.expanduser("~/.ssh/id_rsa"),
-                os.path.expanduser("~/.ssh/id_dsa"),
-                os.path.expanduser("~/.ssh/id_ecdsa"),
-                os.path.expanduser("~/.ssh/id_ed25519"),
-            ]
-            for path in default_key_paths:
-                if os.path.exists(path):
-                    key_path = path
-                    break  # Use the first key found
-            if key_path:
-                client.connect(host, username=username, key_filename=key_path)
-            else:
-                raise Exception("No SSH key found in default locations. Please specify key_path.")
+        client = POOL.get(host, username, key_path)
         print(f"Successfully connected to {host} as {username}")
         return client
     except paramiko.AuthenticationException:
@@ -213,11 +221,12 @@ def execute_command(client, role, command, *args):
             # Split the command and its arguments
             command_parts = [prefix + command] + list(args[:-1])
             ssh_command = " ".join(map(str, command_parts))
-            stdin, stdout, stderr = client.exec_command(ssh_command)
-            stdout_lines = stdout.readlines()
-            stderr_lines = stderr.readlines()
-            exit_code = stdout.channel.recv_exit_status()
-            return "".join(stdout_lines), "".join(stderr_lines), exit_code
+            output = {"stdout": [], "stderr": []}
+            exit_code = stream_remote_command(client, ssh_command, lambda stream, data: output[stream].append(data))
+            if exit_code == NO_EXIT_STATUS:
+                print(f"Warning: '{ssh_command}' ended without an exit status, its output may be incomplete")
+            return (b"".join(output["stdout"]).decode(errors="replace"),
+                    b"".join(output["stderr"]).decode(errors="replace"), exit_code)
         except paramiko.SSHException as e:
             print(f"SSH command execution error: {e}")
             return None
@@ -225,6 +234,165 @@ def execute_command(client, role, command, *args):
             print(f"An error occurred: {e}")
             return None
 
+def stream_remote_command(client, ssh_command, on_output, timeout=None):
+    """
+    Runs a command and hands its output to on_output as it arrives.
+
+    stdout and stderr are read as soon as either has data, so neither
+    channel window fills up while the other is being read and nothing is
+    buffered beyond one chunk.
+
+    Args:
+        client (paramiko.SSHClient): The SSH client object.
+        ssh_command (str): The command line to run.
+        on_output (callable): Called with ("stdout" or "stderr", bytes).
+        timeout (float, optional): Seconds to wait before giving up. Defaults to None.
+
+    Returns:
+        int: The exit code of the command, or NO_EXIT_STATUS if the channel
+            closed without one, e.g. the command was killed by a signal or
+            the connection dropped. The output received is passed on either way.
+    """
+    def received(stream, data):
+        instrument.count("bytes transferred", len(data))
+        on_output(stream, data)
+
+    instrument.count("SSH round trips")
+    channel = client.get_transport().open_session()
+    with instrument.timed("command"):
+        try:
+            channel.exec_command(ssh_command)
+            deadline = time.monotonic() + timeout if timeout else None
+            while True:
+                while channel.recv_ready():
+                    received("stdout", channel.recv(READ_CHUNK))
+                while channel.recv_stderr_ready():
+                    received("stderr", channel.recv_stderr(READ_CHUNK))
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    # the exit status can arrive before the last data, drain until EOF
+                    while True:
+                        data = channel.recv(READ_CHUNK)
+                        if not data:
+                            break
+                        received("stdout", data)
+                    while True:
+                        data = channel.recv_stderr(READ_CHUNK)
+                        if not data:
+                            break
+                        received("stderr", data)
+                    return channel.recv_exit_status()
+                if deadline and time.monotonic() > deadline:
+                    raise TimeoutError(f"command did not finish within {timeout}s")
+                select.select([channel], [], [], 0.1)
+        finally:
+            channel.close()
+
+def parse_host(spec):
+    host, _, port = spec.partition(":")
+    return host, int(port) if port else 22
+
+def execute_command_batch(hosts, role, username, command, *args, key_path=None, max_workers=BATCH_WORKERS,
+                          timeout=None, on_line=None):
+    """
+    Executes the same remote command on many hosts concurrently, with the role checks of execute_command.
+
+    At most max_workers hosts run at once, over pooled connections. Output
+    is passed on line by line while it arrives; only the last TAIL_LINES
+    lines of each stream are kept per host.
+
+    Args:
+        hosts (list): Hostnames or IP addresses, optionally as "host:port".
+        role (str): The role of the user executing the command.
+        username (str): The username for authentication.
+        command (str): The command to execute.
+        *args: Arguments of the command.
+        key_path (str, optional): Path to the private SSH key file. Defaults to None.
+        max_workers (int, optional): Hosts running the command at once. Defaults to BATCH_WORKERS.
+        timeout (float, optional): Seconds each host may take. Defaults to None.
+        on_line (callable, optional): Called with (host, "stdout" or "stderr", line) for every
+            output line. Defaults to printing the line prefixed with the host.
+
+    Returns:
+        dict: host -> {"exit_code", "seconds", "stdout_bytes", "stderr_bytes", "stdout_tail",
+              "stderr_tail", "error"}, or None if permission is denied or a host is listed twice.
+    """
+    if not check_permission(role, command):
+        print(f"Permission denied: Role '{role}' cannot execute command '{command}'")
+        return None
+    if command in LOCAL_COMMANDS:
+        print(f"Error: '{command}' is a local command and cannot be run as a batch.")
+        return None
+    duplicates = sorted({spec for spec in hosts if hosts.count(spec) > 1})
+    if duplicates:
+        # results are keyed by host, so a second run on the same host would hide the first
+        print(f"Error: hosts listed more than once: {', '.join(duplicates)}")
+        return None
+
+    print_lock = threading.Lock()
+
+    def print_line(host, stream, line):
+        with print_lock:
+            print(f"[{host}{':stderr' if stream == 'stderr' else ''}] {line}")
+
+    on_line = on_line or print_line
+    ssh_command = " ".join(map(str, [command] + list(args)))
+
+    def run(spec):
+        result = {"exit_code": None, "seconds": 0.0, "stdout_bytes": 0, "stderr_bytes": 0,
+                  "stdout_tail": collections.deque(maxlen=TAIL_LINES),
+                  "stderr_tail": collections.deque(maxlen=TAIL_LINES), "error": None}
+        partial = {"stdout": b"", "stderr": b""}
+
+        def emit(stream, line):
+            line = line.decode(errors="replace").rstrip("\r")
+            result[stream + "_tail"].append(line)
+            on_line(spec, stream, line)
+
+        def on_output(stream, data):
+            result[stream + "_bytes"] += len(data)
+            lines = (partial[stream] + data).split(b"\n")
+            partial[stream] = lines.pop()
+            if len(partial[stream]) > READ_CHUNK:
+                # a very long line without newline: pass it on in pieces
+                lines.append(partial[stream])
+                partial[stream] = b""
+            for line in lines:
+                emit(stream, line)
+
+        start = time.perf_counter()
+        try:
+            host, port = parse_host(spec)
+            with POOL.connection(host, username, key_path, port) as client:
+                result["exit_code"] = stream_remote_command(client, ssh_command, on_output, timeout)
+            if result["exit_code"] == NO_EXIT_STATUS:
+                result["error"] = "channel closed without an exit status"
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+        for stream, rest in partial.items():
+            if rest:
+                emit(stream, rest)
+        result["seconds"] = time.perf_counter() - start
+        result["stdout_tail"] = list(result["stdout_tail"])
+        result["stderr_tail"] = list(result["stderr_tail"])
+        return spec, result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return dict(executor.map(run, hosts))
+
+def print_batch_summary(results):
+    """
+    Prints one line per host and the overall timing of execute_command_batch results.
+    """
+    for host, result in sorted(results.items()):
+        status = f"error: {result['error']}" if result["error"] else f"exit {result['exit_code']}"
+        print(f"{host:<24} {status:<30} {result['seconds']:7.2f}s "
+              f"{result['stdout_bytes']} B stdout, {result['stderr_bytes']} B stderr")
+    seconds = [result["seconds"] for result in results.values()]
+    failed = sum(1 for result in results.values() if result["error"] or result["exit_code"])
+    if seconds:
+        print(f"{len(results)} hosts, {failed} failed, slowest {max(seconds):.2f}s, "
+              f"total host time {sum(seconds):.2f}s")
+
 if __name__ == "__main__":
     import datetime
 
@@ -233,6 +401,27 @@ if __name__ == "__main__":
     ADMIN_USER = "admin_user"  # Replace with your admin username
     NORMAL_USER = "normal_user"  # Replace with your normal username
 
+    usage = "Usage: ssh_client.py [--stats] [--profile FILE] [admin|user HOST[,HOST...] COMMAND [ARGS...]]"
+    stats, profile, argv = instrument.pop_arguments(sys.argv[1:])
+    if argv[:1] in (["-h"], ["--help"]):
+        print(usage)
+        print("Without arguments, asks for a role and a command to run on HOST.")
+        sys.exit(0)
+    instrument.start(stats, profile)
+
+    if argv:
+        # batch mode: ssh_client.py ROLE HOST[,HOST...] COMMAND [ARGS...]
+        if len(argv) < 3 or argv[0] not in ROLES:
+            print(usage)
+            sys.exit(1)
+        batch_role = argv[0]
+        batch_user = ADMIN_USER if batch_role == "admin" else NORMAL_USER
+        results = execute_command_batch(argv[1].split(","), batch_role, batch_user, argv[2], *argv[3:])
+        if results is None:
+            sys.exit(1)
+        print_batch_summary(results)
+        sys.exit(0)
+
     # 1. Choose the role
     while True:
         user_role = input("Enter your role (admin/user): ").lower()
@@ -278,4 +467,4 @@ if __name__ == "__main__":
         print("Command execution failed or was not permitted.")
 
     # 5. Close the connection
-    client.close()
\ No newline at end of file
+    POOL.close_all()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import atexit
+import contextlib
+import os
+import socket
+import sys
+import threading
+import time
+import weakref
+
+# the one copy of instrument.py is deployed with resource_manager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "P3", "resource_manager"))
+import instrument
+
+paramiko = instrument.lazy_import("paramiko")
+
+KEEPALIVE_SECONDS = 30
+IDLE_TIMEOUT = 300
+DEFAULT_KEY_PATHS = [
+    "~/.ssh/id_rsa",
+    "~/.ssh/id_dsa",
+    "~/.ssh/id_ecdsa",
+    "~/.ssh/id_ed25519",
+]
+
+
+def find_default_key():
+    """
+    Returns the first SSH key found in the default locations, or None.
+    """
+    for path in DEFAULT_KEY_PATHS:
+        path = os.path.expanduser(path)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class SSHPool:
+    """
+    Keeps one open SSH connection per (host, port, username, key) and hands it out again.
+
+    Connections send keepalives so NAT and firewalls do not drop them while
+    they sit in the pool, are checked before being reused and reopened if
+    the transport died. Every get() must be paired with a release(), or use
+    connection(); a connection is only closed once no caller holds it and
+    it was last released idle_timeout seconds ago. Idle connections are
+    evicted whenever the pool is used and all are closed at exit. paramiko
+    clients are thread-safe, so one connection can serve several threads
+    at once.
+    """
+
+    def __init__(self, keepalive=KEEPALIVE_SECONDS, idle_timeout=IDLE_TIMEOUT):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.connections = {}  # key -> [client, last released, callers holding it]
+        self.keys = {}  # client -> key
+        self.lock = threading.Lock()
+        self.key_paths = {}  # username -> key found in the default locations
+        self.sftp_sessions = weakref.WeakKeyDictionary()  # client -> SFTPClient
+
+    def get(self, host, username, key_path=None, port=22):
+        """
+        Returns an open paramiko.SSHClient for host, connecting only if there is none.
+
+        The caller holds the connection until it passes it to release().
+
+        Raises:
+            paramiko.SSHException: If a new connection cannot be established.
+        """
+        if not key_path:
+            if username not in self.key_paths:
+                self.key_paths[username] = find_default_key()
+            key_path = self.key_paths[username]
+            if not key_path:
+                raise Exception("No SSH key found in default locations. Please specify key_path.")
+        key = (host, port, username, key_path)
+        self.evict_idle()
+        with self.lock:
+            entry = self.connections.get(key)
+            if entry:
+                transport = entry[0].get_transport()
+                if transport is not None and transport.is_active():
+                    entry[2] += 1
+                    return entry[0]
+                self._close(key)
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        with instrument.timed("connect"):
+            client.connect(host, port=port, username=username, key_filename=key_path)
+        instrument.count("SSH connections")
+        transport = client.get_transport()
+        transport.set_keepalive(self.keepalive)
+        # small requests and replies would otherwise wait on Nagle and delayed ACKs
+        transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.lock:
+            if key in self.connections:
+                # another thread connected first; keep its connection
+                client.close()
+                self.connections[key][2] += 1
+                return self.connections[key][0]
+            self.connections[key] = [client, time.monotonic(), 1]
+            self.keys[client] = key
+        return client
+
+    def release(self, client):
+        """
+        Hands back a connection returned by get(); it may be evicted once idle.
+        """
+        with self.lock:
+            entry = self.connections.get(self.keys.get(client))
+            # a connection that was replaced after its transport died is already closed
+            if entry and entry[0] is client:
+                entry[2] = max(entry[2] - 1, 0)
+                entry[1] = time.monotonic()
+
+    @contextlib.contextmanager
+    def connection(self, host, username, key_path=None, port=22):
+        """
+        Holds a pooled connection for the duration of a with block.
+        """
+        client = self.get(host, username, key_path, port)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def open_sftp(self, client):
+        """
+        Returns the SFTP session of client, opening one on first use.
+        """
+        with self.lock:
+            sftp = self.sftp_sessions.get(client)
+        channel = sftp.get_channel() if sftp else None
+        if channel is None or channel.closed:
+            sftp = client.open_sftp()
+            with self.lock:
+                self.sftp_sessions[client] = sftp
+        return sftp
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for key in [key for key, (_, used, holders) in self.connections.items() if not holders and used < cutoff]:
+                self._close(key)
+
+    def _close(self, key):
+        client, _, _ = self.connections.pop(key)
+        self.keys.pop(client, None)
+        sftp = self.sftp_sessions.pop(client, None)
+        if sftp:
+            sftp.close()
+        client.close()
+
+    def close_all(self):
+        with self.lock:
+            for key in list(self.connections):
+                self._close(key)
+
+
+POOL = SSHPool()
+atexit.register(POOL.close_all)
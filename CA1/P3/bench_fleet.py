@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import paramiko
+
+import fleet
+
+# the SSH stand-in server is shared with the ssh_client benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "P2"))
+import local_ssh_server
+
+MEM_TOTAL = 4000000
+
+
+def fake_sample(jiffies, memory):
+    return (f"cpu  {jiffies[0]} 0 {jiffies[1]} {jiffies[2]} 0 0 0 0 0 0\n"
+            f"MemTotal:       {MEM_TOTAL} kB\n"
+            f"MemAvailable:   {int(MEM_TOTAL * (1 - memory / 100))} kB\n")
+
+
+class SimulatedHost:
+    """
+    Answers SAMPLE_COMMAND after a random network delay without any SSH.
+
+    slow hosts take longer than the collector timeout and failing hosts
+    raise, so the benchmark shows whether they hold the others up.
+    """
+
+    def __init__(self, name, latency, slow=False, failing=False):
+        self.name = name
+        self.latency = latency
+        self.slow = slow
+        self.failing = failing
+        self.jiffies = [0, 0, 0]  # user, system, idle
+
+    def run(self, command):
+        time.sleep(self.latency * (100 if self.slow else random.uniform(0.5, 1.5)))
+        if self.failing:
+            raise OSError("connection refused")
+        busy = random.randint(0, 100)
+        self.jiffies = [self.jiffies[0] + busy, self.jiffies[1], self.jiffies[2] + 100 - busy]
+        return fake_sample(self.jiffies, random.uniform(20, 60))
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fleet.py's fan-out throughput against simulated hosts.")
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--ssh", type=int, default=0, help="how many of the hosts are real SSH connections to local_ssh_server")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean simulated round trip in seconds")
+    parser.add_argument("--slow", type=float, default=0.02, help="share of hosts slower than the timeout")
+    parser.add_argument("--failing", type=float, default=0.01, help="share of hosts that refuse connections")
+    parser.add_argument("--interval", type=float, default=1)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=fleet.CONCURRENCY)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    # the stand-in server logs every connection the collector closes at the end
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    random.seed(1)
+    hosts = []
+    if args.ssh:
+        key = paramiko.RSAKey.generate(2048)
+        key_path = os.path.join(tempfile.mkdtemp(), "id_rsa")
+        key.write_private_key_file(key_path)
+        port = local_ssh_server.start_local_server(key)
+        for i in range(args.ssh):
+            host = fleet.SSHHost("127.0.0.1", port, "bench", timeout=args.timeout * 4, key_filename=key_path)
+            host.name = f"ssh-{i}"
+            hosts.append(host)
+    for i in range(args.hosts - args.ssh):
+        draw = random.random()
+        hosts.append(SimulatedHost(f"sim-{i}", args.latency, slow=draw < args.slow,
+                                   failing=args.slow <= draw < args.slow + args.failing))
+
+    collector = fleet.FleetCollector(hosts, args.interval, args.timeout, args.concurrency, report=False)
+    start = time.perf_counter()
+    asyncio.run(collector.run(args.duration))
+    elapsed = time.perf_counter() - start
+
+    healthy = [host.name for host in hosts if not getattr(host, "slow", False) and not getattr(host, "failing", False)]
+    rounds = args.duration / args.interval
+    reported = sum(1 for name in healthy if name in collector.latest)
+    latencies = sorted(collector.latencies)
+    print(f"{len(hosts)} hosts ({args.ssh} over SSH), {args.interval}s interval, {args.duration:.0f}s")
+    print(f"samples: {collector.stats['samples']} ({collector.stats['samples'] / elapsed:.0f}/sec, "
+          f"ideal {len(healthy) * rounds / args.duration:.0f}/sec for the healthy hosts)")
+    if latencies:
+        print(f"sample latency p50: {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p95: {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+    print(f"healthy hosts reporting: {reported}/{len(healthy)}")
+    print(f"timeouts: {collector.stats['timeouts']}, errors: {collector.stats['errors']}, "
+          f"skipped while busy: {collector.stats['busy']}, missed ticks: {collector.stats['missed']}")
+
+
+if __name__ == "__main__":
+    main()
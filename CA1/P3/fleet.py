@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import csv
+import os
+import random
+import sys
+import time
+
+# the one copy of instrument.py is deployed with resource_manager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "resource_manager"))
+import instrument
+
+paramiko = instrument.lazy_import('paramiko')
+
+# one exec per sample: the aggregate CPU line and the two memory fields psutil uses
+SAMPLE_COMMAND = "head -1 /proc/stat; grep -E '^(MemTotal|MemAvailable):' /proc/meminfo"
+POLL_INTERVAL = 5
+TIMEOUT = 3
+CONCURRENCY = 100
+QUEUE_SIZE = 1000
+MAX_BACKOFF = 60
+LATENCY_SAMPLES = 10000
+
+
+def parse_sample(text):
+    """
+    Parses the output of SAMPLE_COMMAND.
+
+    Returns:
+        tuple: (busy jiffies, total jiffies, memory usage %), like psutil's
+            cpu_times() and virtual_memory().percent.
+    """
+    busy = total = mem_total = mem_available = None
+    for line in text.splitlines():
+        fields = line.split()
+        if fields and fields[0] == "cpu":
+            # user nice system idle iowait irq softirq steal; guest is already in user
+            times = [int(value) for value in fields[1:9]]
+            total = sum(times)
+            busy = total - times[3] - times[4]
+        elif fields and fields[0] == "MemTotal:":
+            mem_total = int(fields[1])
+        elif fields and fields[0] == "MemAvailable:":
+            mem_available = int(fields[1])
+    if busy is None or not mem_total or mem_available is None:
+        raise ValueError(f"unexpected sample output: {text!r}")
+    return busy, total, round((mem_total - mem_available) / mem_total * 100, 1)
+
+
+def parse_host(spec):
+    """
+    Splits "user@host:port" (user and port optional) into (hostname, port, username).
+    """
+    username, _, address = spec.rpartition("@")
+    hostname, _, port = address.partition(":")
+    return hostname, int(port) if port else 22, username or None
+
+
+def read_inventory(path):
+    """
+    Returns "user@host" specs for every host of an Ansible YAML inventory like hosts.yml.
+    """
+    import yaml
+    with open(path) as f:
+        inventory = yaml.safe_load(f)
+    specs = []
+
+    def walk(group):
+        for name, variables in (group.get("hosts") or {}).items():
+            variables = variables or {}
+            spec = variables.get("ansible_host", name)
+            if variables.get("ansible_user"):
+                spec = f"{variables['ansible_user']}@{spec}"
+            if variables.get("ansible_port"):
+                spec = f"{spec}:{variables['ansible_port']}"
+            specs.append(spec)
+        for child in (group.get("children") or {}).values():
+            walk(child or {})
+
+    for group in (inventory or {}).values():
+        walk(group or {})
+    return specs
+
+
+class SSHHost:
+    """
+    A persistent SSH connection to one monitored host.
+
+    run() is blocking and is called from the collector's worker threads; the
+    connection is opened on first use, kept open between samples and
+    reopened after it drops.
+    """
+
+    def __init__(self, hostname, port=22, username=None, password=None, timeout=TIMEOUT, key_filename=None):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.key_filename = key_filename
+        self.timeout = timeout
+        self.name = f"{hostname}:{port}" if port != 22 else hostname
+        self.client = None
+
+    def _connect(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=self.hostname, port=self.port, username=self.username, password=self.password,
+                       key_filename=self.key_filename, timeout=self.timeout, banner_timeout=self.timeout, auth_timeout=self.timeout)
+        client.get_transport().set_keepalive(POLL_INTERVAL * 6)
+        self.client = client
+
+    def run(self, command):
+        transport = self.client.get_transport() if self.client else None
+        if transport is None or not transport.is_active():
+            self.close()
+            self._connect()
+        _, stdout, _ = self.client.exec_command(command, timeout=self.timeout)
+        return stdout.read().decode()
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            self.client = None
+
+
+class FleetCollector:
+    """
+    Polls CPU and memory usage of many hosts concurrently and aggregates it.
+
+    Every host has its own polling coroutine on a drift-free schedule, so a
+    slow host only delays itself. Samples run on a bounded thread pool, each
+    with its own timeout; a host whose previous sample is still running is
+    skipped rather than queued again, and failing hosts back off
+    exponentially. Results go through a bounded queue to a single
+    aggregator, which slows the pollers down instead of buffering without
+    limit when the output cannot keep up.
+    """
+
+    def __init__(self, hosts, interval=POLL_INTERVAL, timeout=TIMEOUT, concurrency=CONCURRENCY,
+                 queue_size=QUEUE_SIZE, output=None, report=True):
+        self.hosts = hosts
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.output = output
+        self.report = report
+        self.latest = {}  # host name -> (timestamp, cpu %, memory %)
+        self.previous = {}  # host name -> (busy, total) jiffies of the last sample
+        self.pending = {}  # host name -> sample still running in a worker thread
+        self.stats = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    async def run(self, duration=None):
+        self.loop = asyncio.get_running_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.concurrency)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.started = self.loop.time()
+        tasks = [asyncio.create_task(self._poll_host(host)) for host in self.hosts]
+        aggregator = asyncio.create_task(self._aggregate())
+        reporter = asyncio.create_task(self._report()) if self.report else None
+        try:
+            # ends early if a task fails, e.g. the aggregator cannot open the output file
+            await asyncio.wait(tasks + [aggregator], timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks + [reporter]:
+                if task:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if not aggregator.done():
+                # write out what is queued, unless the aggregator fails meanwhile
+                joined = asyncio.ensure_future(self.queue.join())
+                await asyncio.wait([joined, aggregator], return_when=asyncio.FIRST_COMPLETED)
+                joined.cancel()
+            aggregator.cancel()
+            await asyncio.gather(aggregator, return_exceptions=True)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            await asyncio.gather(*[self.loop.run_in_executor(None, host.close) for host in self.hosts])
+        if not aggregator.cancelled():
+            aggregator.result()  # raises what stopped the aggregator
+
+    async def _poll_host(self, host):
+        # spread the first connections over one interval instead of opening them all at once
+        next_time = self.loop.time() + random.uniform(0, self.interval)
+        failures = 0
+        while True:
+            await asyncio.sleep(max(0, next_time - self.loop.time()))
+            if await self._sample(host):
+                failures = 0
+            else:
+                failures += 1
+            delay = self.interval if not failures else min(self.interval * 2 ** failures, MAX_BACKOFF)
+            next_time += delay
+            now = self.loop.time()
+            if next_time < now:
+                self.stats["missed"] += int((now - next_time) // self.interval) + 1
+                next_time += ((now - next_time) // self.interval + 1) * self.interval
+
+    async def _sample(self, host):
+        if host.name in self.pending:
+            self.stats["busy"] += 1
+            return False
+        await self.slots.acquire()
+        start = self.loop.time()
+        future = self.loop.run_in_executor(self.executor, host.run, SAMPLE_COMMAND)
+        self.pending[host.name] = future
+        future.add_done_callback(lambda f: self._finished(host, f))
+        # unlike wait_for, wait leaves a timed out sample running: it keeps its
+        # thread and slot until it really ends
+        done, _ = await asyncio.wait([future], timeout=self.timeout)
+        if not done:
+            self.stats["timeouts"] += 1
+            return False
+        try:
+            busy, total, memory = parse_sample(future.result())
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats[f"error: {type(e).__name__}"] += 1
+            return False
+        self.latencies.append(self.loop.time() - start)
+        self.stats["samples"] += 1
+
+        before = self.previous.get(host.name)
+        self.previous[host.name] = (busy, total)
+        if before is None or total <= before[1]:
+            return True  # CPU usage needs two samples, like psutil.cpu_percent(None)
+        cpu = round((busy - before[0]) / (total - before[1]) * 100, 1)
+        await self.queue.put((time.time(), host.name, cpu, memory))
+        return True
+
+    def _finished(self, host, future):
+        self.slots.release()
+        self.pending.pop(host.name, None)
+        if not future.cancelled() and future.exception() is not None:
+            host.close()
+
+    async def _aggregate(self):
+        out = open(self.output, "a", newline="") if self.output else None
+        writer = csv.writer(out) if out else None
+        last_flush = time.monotonic()
+        try:
+            while True:
+                timestamp, name, cpu, memory = await self.queue.get()
+                self.latest[name] = (timestamp, cpu, memory)
+                if writer:
+                    writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)), name, cpu, memory])
+                    if time.monotonic() - last_flush >= self.interval:
+                        out.flush()
+                        last_flush = time.monotonic()
+                self.queue.task_done()
+        finally:
+            if out:
+                out.close()
+
+    def summary(self):
+        now = time.time()
+        fresh = {name: values for name, values in self.latest.items() if now - values[0] <= self.interval * 3}
+        elapsed = self.loop.time() - self.started
+        line = f"[{time.strftime('%H:%M:%S')}] hosts up: {len(fresh)}/{len(self.hosts)}"
+        if fresh:
+            busiest = max(fresh, key=lambda name: fresh[name][1])
+            line += (f", avg CPU: {sum(v[1] for v in fresh.values()) / len(fresh):.1f}%"
+                     f", avg memory: {sum(v[2] for v in fresh.values()) / len(fresh):.1f}%"
+                     f", busiest: {busiest} ({fresh[busiest][1]}%)")
+        line += (f", samples/sec: {self.stats['samples'] / elapsed if elapsed else 0:.0f}"
+                 f", timeouts: {self.stats['timeouts']}, errors: {self.stats['errors']}")
+        return line
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            print(self.summary())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll CPU and memory usage of many hosts over SSH.")
+    parser.add_argument("hosts", nargs="*", help="hosts as user@host:port")
+    parser.add_argument("--inventory", help="Ansible YAML inventory, e.g. hosts.yml")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("--key", help="private key to log in with; the SSH agent and ~/.ssh keys are tried otherwise")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="samples running at once")
+    parser.add_argument("--output", help="append timestamp,host,cpu,memory rows to this CSV")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    specs = args.hosts + (read_inventory(args.inventory) if args.inventory else [])
+    if not specs:
+        parser.error("no hosts given")
+    hosts = [SSHHost(*parse_host(spec), timeout=args.timeout, key_filename=args.key) for spec in specs]
+    collector = FleetCollector(hosts, args.interval, args.timeout, args.concurrency, output=args.output)
+    try:
+        asyncio.run(collector.run(args.duration))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except OSError as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import time
+
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+import paramiko
+
+import plot
+
+WINDOW_SECONDS = 24 * 3600
+FOLLOW_INTERVAL = 1
+# resource_manager logs one sample per second, so this many fill the window
+SAMPLES_PER_SECOND = 1
+# the time axis reaches this share of the window past the newest sample, so
+# it only has to be redrawn when that margin is used up
+AXIS_MARGIN = 0.02
+
+
+class RingBuffer:
+    """
+    Keeps the last capacity columns of a 2D float array.
+
+    Every column is stored twice, capacity apart, so the columns in order
+    are always one contiguous slice and view() copies nothing.
+    """
+
+    def __init__(self, capacity, rows):
+        self.capacity = capacity
+        self.data = np.zeros((rows, 2 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def extend(self, values):
+        values = values[:, -self.capacity:]
+        added = values.shape[1]
+        positions = (self.start + self.count + np.arange(added)) % self.capacity
+        self.data[:, positions] = values
+        self.data[:, positions + self.capacity] = values
+        total = self.count + added
+        if total > self.capacity:
+            self.start = (self.start + total - self.capacity) % self.capacity
+        self.count = min(total, self.capacity)
+
+    def view(self):
+        return self.data[:, self.start:self.start + self.count]
+
+
+class LiveDashboard:
+    """
+    A CPU and memory usage figure that is updated in place.
+
+    The samples up to the last full draw are part of the saved background;
+    an update restores it and only draws the samples added since then and
+    the status text, then blits. The full figure is redrawn only when the
+    rolling time window moves past its margin or the window is resized.
+    """
+
+    def __init__(self, window=WINDOW_SECONDS, capacity=None):
+        self.window = window
+        self.buffer = RingBuffer(capacity or int(window * SAMPLES_PER_SECOND), 3)
+        self.fig, self.ax = plt.subplots(figsize=(12, 6))
+        self.cpu_line, = self.ax.plot([], [], label='CPU Usage (%)', color='blue')
+        self.memory_line, = self.ax.plot([], [], label='Memory Usage (%)', color='red')
+        self.cpu_tail, = self.ax.plot([], [], color='blue', animated=True)
+        self.memory_tail, = self.ax.plot([], [], color='red', animated=True)
+        self.status = self.ax.text(0.01, 0.97, '', transform=self.ax.transAxes, va='top', animated=True)
+        self.ax.xaxis_date()
+        self.ax.set_ylim(0, 100)
+        self.ax.set_xlabel('Timestamp')
+        self.ax.set_ylabel('Usage (%)')
+        self.ax.set_title('CPU and Memory Usage Over Time (Live)')
+        self.ax.grid(True)
+        self.ax.legend(loc='upper right')
+        plt.setp(self.ax.get_xticklabels(), rotation=45, ha='right')
+        self.fig.tight_layout()
+        self.background = None
+        self.drawn_until = None  # time of the newest sample in the background
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, timestamps, cpu_usages, memory_usages):
+        if len(timestamps):
+            self.buffer.extend(np.vstack([mdates.date2num(timestamps), cpu_usages, memory_usages]))
+
+    def update(self):
+        times, cpu_usages, memory_usages = self.buffer.view()
+        if not len(times):
+            return
+        if self.background is None or times[-1] > self.ax.get_xlim()[1]:
+            days = self.window / 86400
+            self.ax.set_xlim(times[-1] - days, times[-1] + days * AXIS_MARGIN)
+            first = np.searchsorted(times, times[-1] - days)
+            width = int(self.ax.bbox.width)
+            self.cpu_line.set_data(*plot.decimate_min_max(times[first:], cpu_usages[first:], width))
+            self.memory_line.set_data(*plot.decimate_min_max(times[first:], memory_usages[first:], width))
+            self.drawn_until = times[-1]
+            # a full draw; _on_draw saves the new background and adds the rest
+            self.fig.canvas.draw()
+        else:
+            self.fig.canvas.restore_region(self.background)
+            self._draw_animated()
+        self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        times, cpu_usages, memory_usages = self.buffer.view()
+        # start at the newest sample already drawn so the tail joins the line
+        first = np.searchsorted(times, self.drawn_until) if self.drawn_until is not None else len(times)
+        width = max(int(self.ax.bbox.width * AXIS_MARGIN), 1)
+        self.cpu_tail.set_data(*plot.decimate_min_max(times[first:], cpu_usages[first:], width))
+        self.memory_tail.set_data(*plot.decimate_min_max(times[first:], memory_usages[first:], width))
+        if len(times):
+            newest = mdates.num2date(times[-1]).strftime('%Y-%m-%d %H:%M:%S')
+            self.status.set_text(f"{newest}  CPU {cpu_usages[-1]:.1f}%  Memory {memory_usages[-1]:.1f}%")
+        for artist in (self.cpu_tail, self.memory_tail, self.status):
+            self.ax.draw_artist(artist)
+
+
+def follow_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath, interval=FOLLOW_INTERVAL,
+                                     window=WINDOW_SECONDS, cache_dir=plot.CACHE_DIR, duration=None):
+    """
+    Shows a rolling window of a remote usage log and adds new samples as they are logged.
+
+    One SSH connection is kept open and every interval seconds the rows
+    appended since the last check are fetched like in
+    sync_remote_csv_with_ssh_agent, so the local cache stays up to date.
+
+    Args:
+        hostname (str): The hostname or IP address of the remote server.
+        port (int): The SSH port number (usually 22).
+        username (str): The username for SSH authentication.
+        remote_filepath (str): The absolute path to the CSV file on the remote server.
+        interval (float): Seconds between checks for new samples.
+        window (float): Seconds of history shown.
+        cache_dir (str): Local directory for the cached rows and sync state.
+        duration (float): Stop after this many seconds instead of when the window is closed.
+
+    Returns:
+        list: Seconds each update took, from the start of the fetch until the figure was updated.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    rows_path, state_path = plot.cache_paths(hostname, port, remote_filepath, cache_dir)
+    dashboard = LiveDashboard(window)
+    plt.show(block=False)
+
+    latencies = []
+    client = sftp = None
+    first = True
+    stop_at = time.monotonic() + duration if duration else None
+    next_time = time.monotonic()
+    try:
+        while plt.fignum_exists(dashboard.fig.number) and (stop_at is None or time.monotonic() < stop_at):
+            started = time.perf_counter()
+            columns = None
+            try:
+                if sftp is None:
+                    client = plot.connect_with_ssh_agent(hostname, port, username)
+                    sftp = client.open_sftp()
+                columns = plot.sync_cache(sftp, remote_filepath, rows_path, state_path)
+            except FileNotFoundError:
+                pass  # between a rotation and the next write
+            except (paramiko.SSHException, OSError, EOFError) as e:
+                print(f"Lost connection to {hostname}, reconnecting: {e}")
+                if client:
+                    client.close()
+                client = sftp = None
+
+            if first and os.path.exists(rows_path):
+                columns = plot.read_cached_rows(rows_path, dashboard.buffer.capacity)
+                first = False
+            if columns and len(columns[0]):
+                dashboard.add(*columns)
+                dashboard.update()
+                latencies.append(time.perf_counter() - started)
+
+            next_time += interval
+            if next_time < time.monotonic():
+                next_time = time.monotonic()
+            dashboard.fig.canvas.start_event_loop(max(next_time - time.monotonic(), 0.001))
+    finally:
+        if client:
+            client.close()
+    if latencies:
+        ordered = sorted(latencies)
+        print(f"{len(latencies)} updates, median {ordered[len(ordered) // 2] * 1000:.0f} ms, "
+              f"max {ordered[-1] * 1000:.0f} ms")
+    return latencies
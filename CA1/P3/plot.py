@@ -1,8 +1,32 @@
-import paramiko
+import argparse
 import csv
-import matplotlib.pyplot as plt
+import gzip
+import json
+import os
+import posixpath
+import re
+import sys
+import time
 from datetime import datetime
-from io import StringIO
+from io import TextIOWrapper
+
+# the one copy of instrument.py is deployed with resource_manager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource_manager'))
+import instrument
+
+# together they take most of a second to import, which --help does not need
+paramiko = instrument.lazy_import('paramiko')
+plt = instrument.lazy_import('matplotlib.pyplot')
+np = instrument.lazy_import('numpy')
+
+CACHE_DIR = os.path.expanduser("~/.cache/resource_manager_plot")
+# leading bytes of the remote file remembered to notice it was replaced by a rotation
+FINGERPRINT_BYTES = 64
+PARSE_CHUNK_ROWS = 10000
+# record layout of the local cache of parsed samples
+CACHE_DTYPE = [('time', '<M8[s]'), ('cpu', '<f8'), ('memory', '<f8')]
+# where resource_manager keeps its rollups when ROLLUP_ENABLED is set
+ROLLUP_DIR = "/var/log/resource_manager/rollup"
 
 def read_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath):
     """
@@ -17,22 +41,19 @@ def read_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath):
     Returns:
         list: A list of rows from the CSV file, or None if an error occurs.
     """
+    client = None
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        # Use the ssh-agent for authentication
-        agent = paramiko.Agent()
-
-        client.connect(hostname=hostname, port=port, username=username)
+        client = connect_with_ssh_agent(hostname, port, username)
 
         sftp = client.open_sftp()
         with sftp.open(remote_filepath, 'r') as remote_file:
-            file_content = remote_file.read().decode('utf-8')
-            csv_reader = csv.reader(StringIO(file_content))
-            header = next(csv_reader) # Skip header
-            data = list(csv_reader)
-        client.close()
+            remote_file.prefetch()
+            # parse while downloading instead of holding the bytes, the text and a copy
+            csv_reader = csv.reader(TextIOWrapper(remote_file, encoding='utf-8', newline=''))
+            header = next(csv_reader, None) # Skip header
+            with instrument.timed("download"):
+                data = list(csv_reader)
+            instrument.count("bytes transferred", remote_file.tell())
         return data
 
     except paramiko.AuthenticationException:
@@ -47,8 +68,184 @@ def read_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath):
     except Exception as e:
         print(f"An error occurred: {e}")
         return None
+    finally:
+        if client:
+            client.close()
+
+def connect_with_ssh_agent(hostname, port, username):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    # Use the ssh-agent for authentication
+    agent = paramiko.Agent()
+
+    with instrument.timed("connect"):
+        client.connect(hostname=hostname, port=port, username=username)
+    instrument.count("SSH connections")
+    return client
+
+def cache_paths(hostname, port, remote_filepath, cache_dir=CACHE_DIR):
+    """
+    Returns the local (rows, state) file paths caching one remote file.
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', f"{hostname}_{port}_{remote_filepath.strip('/')}")
+    return os.path.join(cache_dir, name + '.bin'), os.path.join(cache_dir, name + '.json')
+
+def load_sync_state(state_path, rows_path):
+    if not os.path.exists(rows_path):
+        # an offset without the rows it covers would skip them
+        return {'offset': 0, 'fingerprint': ''}
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'offset': 0, 'fingerprint': ''}
+
+def sync_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath, cache_dir=CACHE_DIR):
+    """
+    Appends the rows added to a remote CSV file since the last sync to a local cache.
+
+    The byte offset reached in the remote file is remembered per host and
+    file, so only new bytes are fetched with a ranged SFTP read and parsed;
+    a trailing partial line is left for the next sync. The cache holds the
+    parsed samples as fixed-width binary records (CACHE_DTYPE), so reading
+    it back parses nothing. If the remote file got shorter or its first
+    bytes changed, it was truncated or rotated: the rest of the rotated
+    segment is read before the new file is read from the start.
+
+    Args:
+        hostname (str): The hostname or IP address of the remote server.
+        port (int): The SSH port number (usually 22).
+        username (str): The username for SSH authentication.
+        remote_filepath (str): The absolute path to the CSV file on the remote server.
+        cache_dir (str): Local directory for the cached rows and sync state.
+
+    Returns:
+        str: The path of the local cache file, or None if nothing could be read.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    rows_path, state_path = cache_paths(hostname, port, remote_filepath, cache_dir)
+    client = None
+    try:
+        client = connect_with_ssh_agent(hostname, port, username)
+        timestamps, _, _ = sync_cache(client.open_sftp(), remote_filepath, rows_path, state_path)
+        print(f"Fetched {len(timestamps)} new samples from {hostname}:{remote_filepath}")
+    except paramiko.AuthenticationException:
+        print("Authentication failed, please verify your SSH agent is running and has the key loaded.")
+    except paramiko.SSHException as ssh_exception:
+        print(f"Could not establish SSH connection: {ssh_exception}")
+    except FileNotFoundError:
+        print(f"Remote file not found: {remote_filepath}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if client:
+            client.close()
+    if not os.path.exists(rows_path):
+        return None
+    return rows_path
+
+def sync_cache(sftp, remote_filepath, rows_path, state_path):
+    """
+    Does one sync of sync_remote_csv_with_ssh_agent over an open SFTP session.
+
+    Returns:
+        tuple: (timestamps, CPU usage, memory usage) arrays of the samples added to the cache.
+    """
+    state = load_sync_state(state_path, rows_path)
+    new_bytes, state = fetch_new_bytes(sftp, remote_filepath, state)
+    with instrument.timed("parse"):
+        columns = parse_usage_rows(list(csv.reader(new_bytes.decode('utf-8', errors='replace').splitlines())))
+    instrument.count("samples parsed", len(columns[0]))
+    append_cached_rows(rows_path, *columns)
+    # saved after the rows, so a crash in between fetches them again rather than never
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(state_path + '.tmp', state_path)
+    return columns
+
+def fetch_new_bytes(sftp, remote_filepath, state):
+    """
+    Reads the complete lines appended to a remote file since state was saved.
+
+    Returns:
+        tuple: (the lines, the state to save once they are stored)
+    """
+    with instrument.timed("sync"):
+        size = sftp.stat(remote_filepath).st_size
+        with sftp.open(remote_filepath, 'rb') as remote_file:
+            head = remote_file.read(FINGERPRINT_BYTES).decode('utf-8', errors='replace')
+            offset = state['offset']
+            rotated = b''
+            if size < offset or not head.startswith(state['fingerprint']):
+                print(f"Remote file was rotated or truncated, reading it from the start: {remote_filepath}")
+                rotated = read_rotated_rest(sftp, remote_filepath, state)
+                offset = 0
+            new_bytes = b''
+            if size > offset:
+                remote_file.seek(offset)
+                remote_file.prefetch(size)
+                new_bytes = remote_file.read(size - offset)
+    instrument.count("bytes transferred", min(size, FINGERPRINT_BYTES) + len(rotated) + len(new_bytes))
+    complete = new_bytes[:new_bytes.rfind(b'\n') + 1]
+    return rotated + complete, {'offset': offset + len(complete), 'fingerprint': head, 'size': size}
+
+def read_rotated_rest(sftp, remote_filepath, state):
+    """
+    Returns what was logged to a remote file after the last sync and before
+    it was rotated: the rest of the rotated segment that starts with the
+    remembered first bytes, then every segment rotated after it.
+    """
+    directory, name = posixpath.split(remote_filepath)
+    # resource_manager names segments FILE.<time>[.gz], so they sort oldest first
+    segments = sorted(entry for entry in sftp.listdir(directory or '.')
+                      if entry.startswith(name + '.') and entry[len(name) + 1:][:1].isdigit())
+    parts = []
+    for segment in segments:
+        with sftp.open(posixpath.join(directory, segment), 'rb') as raw:
+            f = gzip.GzipFile(fileobj=raw) if segment.endswith('.gz') else raw
+            if not parts:
+                if not f.read(FINGERPRINT_BYTES).decode('utf-8', errors='replace').startswith(state['fingerprint']):
+                    continue
+                f.seek(state['offset'])
+            parts.append(f.read())
+    if not parts and state['offset']:
+        print(f"No rotated segment of {remote_filepath} starts like the synced file, "
+              f"its rows logged after the last sync are missing")
+    return b''.join(parts)
+
+def append_cached_rows(rows_path, timestamps, cpu_usages, memory_usages):
+    records = np.empty(len(timestamps), dtype=CACHE_DTYPE)
+    records['time'] = timestamps
+    records['cpu'] = cpu_usages
+    records['memory'] = memory_usages
+    with open(rows_path, 'ab') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size % records.itemsize:
+            # a crash left part of a record; appending after it would shift every later one
+            f.truncate(size - size % records.itemsize)
+            f.seek(0, os.SEEK_END)
+        records.tofile(f)
+
+def read_cached_rows(rows_path, last=None):
+    """
+    Returns the samples of a local cache file written by sync_remote_csv_with_ssh_agent.
+
+    Args:
+        rows_path (str): The cache file.
+        last (int): Only read this many of the newest samples.
+
+    Returns:
+        tuple: (timestamps as datetime64[s], CPU usage, memory usage) arrays.
+    """
+    dtype = np.dtype(CACHE_DTYPE)
+    count = os.path.getsize(rows_path) // dtype.itemsize
+    skip = max(count - last, 0) if last is not None else 0
+    with instrument.timed("read cache"):
+        records = np.fromfile(rows_path, dtype=dtype, count=count - skip, offset=skip * dtype.itemsize)
+    return records['time'], records['cpu'], records['memory']
 
-def plot_resource_usage_from_remote_ssh_agent(hostname, port, username, remote_filepath):
+def plot_resource_usage_from_remote_ssh_agent(hostname, port, username, remote_filepath, sync=True, output=None):
     """
     Reads CPU and memory usage from a remote CSV file via SSH using ssh-agent and plots it.
 
@@ -57,50 +254,197 @@ def plot_resource_usage_from_remote_ssh_agent(hostname, port, username, remote_f
         port (int): The SSH port number (usually 22).
         username (str): The username for SSH authentication.
         remote_filepath (str): The absolute path to the CSV file on the remote server.
+        sync (bool): Only fetch what was appended since the last run and plot
+            the local cache, instead of downloading the whole file.
+        output (str): Save the figure to this file instead of showing it.
     """
-    data = read_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath)
-
-    if data:
-        timestamps = []
-        cpu_usages = []
-        memory_usages = []
-
-        for row in data:
-            if len(row) == 3:
-                timestamp_str, cpu_str, memory_str = row
-                try:
-                    timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                    cpu_usage = float(cpu_str)
-                    memory_usage = float(memory_str)
-                    timestamps.append(timestamp)
-                    cpu_usages.append(cpu_usage)
-                    memory_usages.append(memory_usage)
-                except ValueError:
-                    print(f"Skipping invalid row: {row}")
+    columns = None
+    if sync:
+        rows_path = sync_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath)
+        if rows_path:
+            columns = read_cached_rows(rows_path)
+    else:
+        data = read_remote_csv_with_ssh_agent(hostname, port, username, remote_filepath)
+        if data:
+            with instrument.timed("parse"):
+                columns = parse_usage_rows(data)
+            instrument.count("samples parsed", len(columns[0]))
+
+    if columns:
+        timestamps, cpu_usages, memory_usages = columns
+        if len(timestamps):
+            with instrument.timed("plot"):
+                fig = plt.figure(figsize=(12, 6))
+                # about two points per horizontal pixel is all the figure can show
+                width = int(fig.get_figwidth() * fig.dpi)
+                plt.plot(*decimate_min_max(timestamps, cpu_usages, width), label='CPU Usage (%)', color='blue')
+                plt.plot(*decimate_min_max(timestamps, memory_usages, width), label='Memory Usage (%)', color='red')
+                plt.xlabel('Timestamp')
+                plt.ylabel('Usage (%)')
+                plt.title('CPU and Memory Usage Over Time (Remote)')
+                plt.grid(True)
+                plt.legend()
+                plt.xticks(rotation=45, ha='right')
+                plt.tight_layout()
+            if output:
+                with instrument.timed("save"):
+                    plt.savefig(output)
+                print(f"Saved plot to {output}")
             else:
-                print(f"Skipping row with incorrect number of columns: {row}")
-
-        if timestamps:
-            plt.figure(figsize=(12, 6))
-            plt.plot(timestamps, cpu_usages, label='CPU Usage (%)', color='blue')
-            plt.plot(timestamps, memory_usages, label='Memory Usage (%)', color='red')
-            plt.xlabel('Timestamp')
-            plt.ylabel('Usage (%)')
-            plt.title('CPU and Memory Usage Over Time (Remote)')
-            plt.grid(True)
-            plt.legend()
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            plt.show()
+                plt.show()
         else:
             print("No valid data to plot from the remote file.")
     else:
         print("Failed to read data from the remote server.")
 
+def plot_resource_usage_from_rollup(directory=ROLLUP_DIR, hours=24, output=None):
+    """
+    Plots the last hours of resource_manager rollups from a local directory.
+
+    The rollup picks the coarsest resolution that still gives enough points
+    for the span, so a year costs about as much as a day. Averages are drawn
+    as lines over the min-max range of each bucket.
+
+    Args:
+        directory (str): The rollup directory, ROLLUP_PATH of resource_manager.
+        hours (float): Length of the span ending now.
+        output (str): Save the figure to this file instead of showing it.
+    """
+    from rollup import Rollup
+    rollup = Rollup(directory, read_only=True)
+    with instrument.timed("query rollup"):
+        res, records = rollup.query(time.time() - hours * 3600)
+    instrument.count("samples parsed", len(records))
+    if not len(records):
+        print(f"No rollups for the last {hours:g} hours in {directory}")
+        return
+    timestamps = records['time'].astype('int64').astype('datetime64[s]')
+    with instrument.timed("plot"):
+        plt.figure(figsize=(12, 6))
+        for metric, label, color in (('cpu', 'CPU Usage (%)', 'blue'), ('memory', 'Memory Usage (%)', 'red')):
+            plt.fill_between(timestamps, records[f'{metric}_min'], records[f'{metric}_max'], color=color, alpha=0.2)
+            plt.plot(timestamps, records[f'{metric}_avg'], label=label, color=color)
+        plt.xlabel('Timestamp')
+        plt.ylabel('Usage (%)')
+        plt.title(f'CPU and Memory Usage Over Time ({res}s rollup, min-max shaded)')
+        plt.grid(True)
+        plt.legend()
+        plt.xticks(rotation=45, ha='right')
+        plt.tight_layout()
+    if output:
+        with instrument.timed("save"):
+            plt.savefig(output)
+        print(f"Saved plot to {output}")
+    else:
+        plt.show()
+
+def parse_usage_rows(rows):
+    """
+    Converts timestamp,cpu,memory rows to NumPy arrays in bulk.
+
+    Args:
+        rows (list): Rows as read from the CSV file.
+
+    Returns:
+        tuple: (timestamps as datetime64[s], CPU usage, memory usage) arrays.
+    """
+    valid = [row for row in rows if len(row) == 3]
+    if len(valid) < len(rows):
+        print(f"Skipping {len(rows) - len(valid)} rows with incorrect number of columns")
+    try:
+        return columns_to_arrays(valid)
+    except ValueError:
+        pass
+
+    # some rows do not parse: only check the chunks they are in row by row
+    checked = []
+    for start in range(0, len(valid), PARSE_CHUNK_ROWS):
+        chunk = valid[start:start + PARSE_CHUNK_ROWS]
+        try:
+            columns_to_arrays(chunk)
+            checked.extend(chunk)
+            continue
+        except ValueError:
+            pass
+        for row in chunk:
+            try:
+                timestamp = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+                float(row[1])
+                float(row[2])
+            except ValueError:
+                print(f"Skipping invalid row: {row}")
+                continue
+            # strptime also takes e.g. unpadded dates, which datetime64 rejects
+            checked.append([timestamp.isoformat(), row[1], row[2]])
+    return columns_to_arrays(checked)
+
+def columns_to_arrays(rows):
+    count = len(rows)
+    timestamps = np.array([row[0] for row in rows], dtype='datetime64[s]')
+    cpu_usages = np.fromiter(map(float, (row[1] for row in rows)), float, count)
+    memory_usages = np.fromiter(map(float, (row[2] for row in rows)), float, count)
+    return timestamps, cpu_usages, memory_usages
+
+def decimate_min_max(x, y, width):
+    """
+    Reduces a series to about 2 * width points for drawing.
+
+    The series is split into width buckets of consecutive samples and only
+    the lowest and highest sample of each bucket is kept, in time order, so
+    short spikes stay visible however many samples there are.
+
+    Args:
+        x (numpy.ndarray): Sample times.
+        y (numpy.ndarray): Sample values.
+        width (int): Number of buckets, usually the plot width in pixels.
+
+    Returns:
+        tuple: The kept (x, y) samples.
+    """
+    count = len(y)
+    if count <= 2 * width:
+        return x, y
+    size = -(-count // width)
+    buckets = count // size
+    blocks = y[:buckets * size].reshape(buckets, size)
+    starts = np.arange(buckets) * size
+    keep = np.unique(np.concatenate([
+        starts + blocks.argmin(axis=1),
+        starts + blocks.argmax(axis=1),
+        np.arange(buckets * size, count),
+    ]))
+    return x[keep], y[keep]
+
 # Your server details and remote file path
 remote_host = '192.168.56.13'
 remote_port = 22
 remote_user = 'vagrant'
 remote_file = '/var/log/resource_manager/system_monitor.csv'
 
-plot_resource_usage_from_remote_ssh_agent(remote_host, remote_port, remote_user, remote_file)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot CPU and memory usage logged on a remote server.")
+    parser.add_argument("--host", default=remote_host)
+    parser.add_argument("--port", type=int, default=remote_port)
+    parser.add_argument("--user", default=remote_user)
+    parser.add_argument("--file", default=remote_file)
+    parser.add_argument("--full", action="store_true", help="download the whole file instead of syncing the local cache")
+    parser.add_argument("--save", metavar="FILE", help="save the figure (e.g. usage.png) instead of opening a window")
+    parser.add_argument("--follow", action="store_true", help="keep the window open and add new samples as they are logged")
+    parser.add_argument("--window", type=float, default=24, help="hours shown in follow and rollup mode")
+    parser.add_argument("--rollup", nargs="?", const=ROLLUP_DIR, metavar="DIR",
+                        help=f"plot the last --window hours from local rollups instead (default DIR: {ROLLUP_DIR})")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start(args.stats, args.profile)
+    if args.rollup:
+        if args.save:
+            plt.switch_backend('Agg')
+        plot_resource_usage_from_rollup(args.rollup, args.window, output=args.save)
+    elif args.follow:
+        from live_plot import follow_remote_csv_with_ssh_agent
+        follow_remote_csv_with_ssh_agent(args.host, args.port, args.user, args.file, window=args.window * 3600)
+    else:
+        if args.save:
+            plt.switch_backend('Agg')
+        plot_resource_usage_from_remote_ssh_agent(args.host, args.port, args.user, args.file, sync=not args.full,
+                                                  output=args.save)
\ No newline at end of file
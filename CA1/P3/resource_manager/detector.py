@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import csv
+import gzip
+import os
+import time
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_NAME = "resource_manager"
+CPU_PERIOD = 100000
+# share of one CPU left to a throttled process at each level; past the last one it is stopped
+CPU_QUOTAS = (0.5, 0.25, 0.1)
+NICE_STEP = 6
+MAX_NICE = 19
+# usage must stay this many points below a threshold before throttled processes are released
+RELEASE_MARGIN = 10
+
+
+class Detector:
+    """
+    Decides when to act on CPU and memory usage from a stream of samples.
+
+    CPU is smoothed with an EWMA and only acted on once the smoothed value
+    has stayed above the threshold for sustain seconds; every further
+    sustain period raises the throttle level, and after the last level the
+    process is stopped. Memory is fitted with a least-squares line over the
+    last slope_window seconds; a process is throttled as soon as the line
+    reaches the threshold within horizon seconds, and killed only when the
+    threshold is actually crossed. Throttling is lifted only once both have
+    stayed release_margin below their threshold for sustain seconds, so
+    usage hovering at the threshold does not throttle and release in turn.
+    """
+
+    def __init__(self, cpu_threshold, memory_threshold, alpha=0.3, sustain=10, horizon=60, slope_window=30,
+                 levels=len(CPU_QUOTAS), release_margin=RELEASE_MARGIN):
+        self.cpu_threshold = cpu_threshold
+        self.memory_threshold = memory_threshold
+        self.alpha = alpha
+        self.sustain = sustain
+        self.horizon = horizon
+        self.slope_window = slope_window
+        self.levels = levels
+        self.release_margin = release_margin
+        self.cpu_ewma = None
+        self.cpu_over_since = None
+        self.calm_since = None
+        self.memory = collections.deque()
+
+    def update(self, timestamp, cpu_usage, memory_usage):
+        """
+        Returns (action, resource, level) where action is None, 'throttle',
+        'stop' or 'kill' and resource is 'cpu' or 'mem'.
+        """
+        decision = self._decide(timestamp, cpu_usage, memory_usage)
+        if (decision[0] is None and self.cpu_ewma <= self.cpu_threshold - self.release_margin
+                and memory_usage <= self.memory_threshold - self.release_margin):
+            if self.calm_since is None:
+                self.calm_since = timestamp
+        else:
+            self.calm_since = None
+        return decision
+
+    def is_calm(self, timestamp):
+        """
+        Tells whether usage has stayed release_margin below both thresholds for sustain seconds.
+        """
+        return self.calm_since is not None and timestamp - self.calm_since >= self.sustain
+
+    def _decide(self, timestamp, cpu_usage, memory_usage):
+        # every sample goes into the averages, also the ones that end in a kill
+        predicted = self.predict_memory(timestamp, memory_usage)
+        cpu = self.smooth_cpu(cpu_usage)
+        if cpu > self.cpu_threshold:
+            if self.cpu_over_since is None:
+                self.cpu_over_since = timestamp
+        else:
+            self.cpu_over_since = None
+
+        if memory_usage > self.memory_threshold:
+            return 'kill', 'mem', self.levels
+        if self.cpu_over_since is not None:
+            level = int((timestamp - self.cpu_over_since) // self.sustain)
+            if level > self.levels:
+                return 'stop', 'cpu', level
+            if level >= 1:
+                return 'throttle', 'cpu', level
+
+        if predicted is not None and predicted > self.memory_threshold:
+            return 'throttle', 'mem', 1
+        return None, None, 0
+
+    def smooth_cpu(self, cpu_usage):
+        if self.cpu_ewma is None:
+            self.cpu_ewma = cpu_usage
+        else:
+            self.cpu_ewma = self.alpha * cpu_usage + (1 - self.alpha) * self.cpu_ewma
+        return self.cpu_ewma
+
+    def predict_memory(self, timestamp, memory_usage):
+        """
+        Extrapolates memory usage horizon seconds ahead, or None while the
+        window is too short or memory is not growing.
+        """
+        samples = self.memory
+        samples.append((timestamp, memory_usage))
+        while samples[0][0] < timestamp - self.slope_window:
+            samples.popleft()
+        if len(samples) < 3 or samples[-1][0] - samples[0][0] < self.slope_window / 2:
+            return None
+        n = len(samples)
+        mean_t = sum(t for t, _ in samples) / n
+        mean_m = sum(m for _, m in samples) / n
+        var = sum((t - mean_t) ** 2 for t, _ in samples)
+        if not var:
+            return None
+        slope = sum((t - mean_t) * (m - mean_m) for t, m in samples) / var
+        if slope <= 0:
+            return None
+        return memory_usage + slope * self.horizon
+
+
+class Throttler:
+    """
+    Slows a process down before it has to be stopped.
+
+    Where cgroup v2 is writable the process is moved into its own group
+    under CGROUP_NAME and limited with cpu.max (CPU) or memory.high
+    (memory); otherwise its nice value is raised by NICE_STEP per level
+    above the one it had. release_all() restores both.
+    """
+
+    def __init__(self, root=CGROUP_ROOT):
+        self.root = root
+        self.base = os.path.join(root, CGROUP_NAME)
+        self.throttled = {}  # pid -> {"cgroup": original cgroup, "nice": original nice}
+        self.applied = {}  # (pid, resource) -> level
+        self.cgroup = self._setup_cgroup()
+
+    def _setup_cgroup(self):
+        """
+        Creates the base group with the cpu and memory controllers enabled for
+        its children, and tells whether that worked.
+        """
+        try:
+            os.makedirs(self.base, exist_ok=True)
+            # a controller must be enabled in every ancestor to reach the per-process groups
+            for parent in (self.root, self.base):
+                self._write(os.path.join(parent, "cgroup.subtree_control"), "+cpu +memory")
+            return True
+        except OSError:
+            return False
+
+    def _write(self, path, value):
+        with open(path, "w") as f:
+            f.write(value)
+
+    def throttle(self, process, resource, level):
+        """
+        Applies the limit for level, or returns None if it is already applied.
+
+        The level only counts as applied once a write succeeded, so a failed
+        one is tried again on the next call.
+        """
+        pid = process.pid
+        level = min(level, len(CPU_QUOTAS))
+        if self.applied.get((pid, resource)) == level:
+            return None
+        saved = self.throttled.setdefault(pid, {"cgroup": None, "nice": None})
+        if self.cgroup:
+            try:
+                group = os.path.join(self.base, str(pid))
+                os.makedirs(group, exist_ok=True)
+                if resource == 'cpu':
+                    quota = int(CPU_QUOTAS[level - 1] * CPU_PERIOD)
+                    self._write(os.path.join(group, "cpu.max"), f"{quota} {CPU_PERIOD}")
+                else:
+                    self._write(os.path.join(group, "memory.high"), str(process.memory_info().rss))
+                if saved["cgroup"] is None:
+                    saved["cgroup"] = self._current_cgroup(pid)
+                    self._write(os.path.join(group, "cgroup.procs"), str(pid))
+                self.applied[(pid, resource)] = level
+                return f"cgroup {resource} level {level}"
+            except OSError:
+                pass
+        current = process.nice()
+        if saved["nice"] is None:
+            saved["nice"] = current
+        # relative to where it started, and never lower than it is now
+        process.nice(min(MAX_NICE, max(current, saved["nice"] + NICE_STEP * level)))
+        self.applied[(pid, resource)] = level
+        return f"nice {process.nice()}"
+
+    def _current_cgroup(self, pid):
+        with open(f"/proc/{pid}/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return line.strip()[3:]
+        return None
+
+    def release_all(self):
+        """
+        Moves every throttled process back to its original cgroup and nice value and drops the limits.
+        """
+        for pid, saved in self.throttled.items():
+            try:
+                if saved["nice"] is not None:
+                    os.setpriority(os.PRIO_PROCESS, pid, saved["nice"])
+            except OSError:
+                pass  # the process exited
+            try:
+                if saved["cgroup"] is not None:
+                    self._write(os.path.join(self.root, saved["cgroup"].lstrip("/"), "cgroup.procs"), str(pid))
+                os.rmdir(os.path.join(self.base, str(pid)))
+            except OSError:
+                pass
+        self.throttled = {}
+        self.applied = {}
+
+
+def read_usage_log(path):
+    """
+    Yields (epoch, cpu, memory) from a usage CSV, gzipped or not, skipping bad rows.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="") as f:
+        for row in csv.reader(f):
+            try:
+                timestamp = time.mktime(time.strptime(row[0], "%Y-%m-%d %H:%M:%S"))
+                yield timestamp, float(row[1]), float(row[2])
+            except (ValueError, IndexError):
+                continue
+
+
+def replay(paths, cpu_threshold, memory_threshold, **options):
+    """
+    Runs recorded usage logs through a Detector as fast as they can be read
+    and prints every change of decision next to what the single-sample
+    threshold check would have done.
+    """
+    detector = Detector(cpu_threshold, memory_threshold, **options)
+    decisions = collections.Counter()
+    legacy = 0
+    samples = 0
+    last = None
+    start = time.perf_counter()
+    for path in paths:
+        for timestamp, cpu_usage, memory_usage in read_usage_log(path):
+            samples += 1
+            if cpu_usage > cpu_threshold or memory_usage > memory_threshold:
+                legacy += 1
+            decision = detector.update(timestamp, cpu_usage, memory_usage)
+            decisions[decision[0]] += 1
+            if decision[:2] != last:
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+                print(f"{stamp} cpu={cpu_usage:5.1f} mem={memory_usage:5.1f} -> {decision[0] or 'ok'}"
+                      + (f" {decision[1]} level {decision[2]}" if decision[0] else ""))
+                last = decision[:2]
+    elapsed = time.perf_counter() - start
+    print(f"\n{samples} samples in {elapsed:.2f}s ({samples / elapsed if elapsed else 0:.0f} samples/sec)")
+    print(f"single-sample threshold would have acted on {legacy} samples")
+    for action in ('throttle', 'stop', 'kill'):
+        print(f"{action}: {decisions[action]} samples")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded usage logs through the predictive detector.")
+    parser.add_argument("logs", nargs="+", help="usage CSV files, oldest first (.gz accepted)")
+    parser.add_argument("--cpu-threshold", type=float, default=80)
+    parser.add_argument("--memory-threshold", type=float, default=80)
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--sustain", type=float, default=10)
+    parser.add_argument("--horizon", type=float, default=60)
+    args = parser.parse_args()
+    replay(args.logs, args.cpu_threshold, args.memory_threshold,
+           alpha=args.alpha, sustain=args.sustain, horizon=args.horizon)
+
+
+if __name__ == "__main__":
+    main()
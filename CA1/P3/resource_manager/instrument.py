@@ -0,0 +1,217 @@
+# Opt-in timers, counters and profiling for the command line tools.
+# Nothing is recorded until start() enables it, so count() and timed() can
+# stay in the hot paths: switched off they cost one global lookup. This is the
+# only copy: the playbook deploys it with resource_manager, and the tools in
+# other directories add this directory to sys.path.
+import atexit
+import collections
+import importlib
+import signal
+import sys
+import threading
+import time
+
+# sampling period of --profile FILE.folded, in seconds of CPU time
+SAMPLE_INTERVAL = 0.005
+
+enabled = False
+counters = collections.Counter()
+timers = collections.defaultdict(lambda: [0, 0.0])  # stage -> [calls, seconds]
+lock = threading.Lock()
+
+
+def count(name, n=1):
+    """
+    Adds n to counter name, if instrumentation is enabled.
+    """
+    if enabled:
+        with lock:
+            counters[name] += n
+
+
+class timed:
+    """
+    Context manager adding the time spent in its block to stage name.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            seconds = time.perf_counter() - self.start
+            with lock:
+                timer = timers[self.name]
+                timer[0] += 1
+                timer[1] += seconds
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access.
+
+    Attributes are copied onto the stand-in when first read, so later reads
+    are plain attribute lookups, cheap enough for per-packet code. A module
+    attribute rebound after that first read is not seen through the stand-in.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            # import_module also waits for an import another thread started
+            if self._name in sys.modules:
+                module = importlib.import_module(self._name)
+            else:
+                with timed(f"import {self._name}"):
+                    module = importlib.import_module(self._name)
+            self._module = module
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+
+def lazy_import(name):
+    """
+    Returns a LazyModule for name, so the import cost is only paid by the code paths that use it.
+
+    Args:
+        name (str): Module to import, e.g. "numpy" or "matplotlib.pyplot".
+
+    Returns:
+        LazyModule: Forwards attribute access to the module once it is imported.
+    """
+    return LazyModule(name)
+
+
+class StackSampler:
+    """
+    Samples the stacks of all threads on a CPU-time timer and counts them.
+
+    The result is written in the folded format of flamegraph.pl, which
+    speedscope and inferno read too: one line per distinct stack, frames
+    separated by semicolons, followed by the number of samples.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        current = threading.get_ident()
+        for ident, thread_frame in sys._current_frames().items():
+            # the handler's own frame is not part of the sampled code
+            thread_frame = frame if ident == current else thread_frame
+            stack = []
+            while thread_frame is not None:
+                code = thread_frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                thread_frame = thread_frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+
+def add_arguments(parser):
+    """
+    Adds --stats and --profile to an argparse parser; pass the parsed arguments to start().
+    """
+    parser.add_argument("--stats", action="store_true", help="print stage timings and counters at exit")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the run: FILE.folded gets sampled stacks for flame graphs, "
+                             "any other name cProfile stats (python -m pstats FILE); implies --stats")
+
+
+def pop_arguments(argv):
+    """
+    Removes --stats and --profile FILE from the front of argv, for scripts without argparse.
+
+    Returns:
+        tuple: (stats, profile path or None, remaining arguments).
+    """
+    argv = list(argv)
+    stats = False
+    profile = None
+    while argv and argv[0] in ("--stats", "--profile"):
+        option = argv.pop(0)
+        if option == "--stats":
+            stats = True
+        elif argv:
+            profile = argv.pop(0)
+    return stats, profile, argv
+
+
+def start(stats=False, profile=None):
+    """
+    Enables the counters and timers, and starts profiling if profile is a path.
+
+    The report is printed to stderr and the profile written when the
+    process exits, including through sys.exit() and KeyboardInterrupt.
+
+    Args:
+        stats (bool): Print the stage timings and counters at exit.
+        profile (str): Write a profile to this file; see add_arguments.
+    """
+    global enabled
+    if not stats and not profile:
+        return
+    enabled = True
+    started = time.perf_counter()
+    profiler = None
+    if profile and profile.endswith(".folded"):
+        profiler = StackSampler()
+        profiler.start()
+    elif profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        if profiler is not None:
+            if isinstance(profiler, StackSampler):
+                profiler.stop()
+                profiler.write(profile)
+            else:
+                profiler.disable()
+                profiler.dump_stats(profile)
+            print(f"Profile written to {profile}", file=sys.stderr)
+        report(time.perf_counter() - started)
+
+    atexit.register(finish)
+
+
+def report(elapsed=None, file=None):
+    """
+    Prints the stage timings, slowest first, and the counters.
+    """
+    file = file or sys.stderr
+    with lock:
+        stages = sorted(timers.items(), key=lambda item: item[1][1], reverse=True)
+        totals = sorted(counters.items())
+    if elapsed is not None:
+        print(f"\n--- {elapsed:.3f}s since start ---", file=file)
+    for name, (calls, seconds) in stages:
+        print(f"{name:<32} {seconds:9.3f}s {calls:9d} calls {seconds / calls * 1000:10.3f} ms/call", file=file)
+    for name, value in totals:
+        rate = f" ({value / elapsed:.0f}/s)" if elapsed else ""
+        print(f"{name:<32} {value:>10}{rate}", file=file)
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+import argparse
+import bisect
+import csv
+import os
+import struct
+import sys
+import time
+
+SEGMENT_RECORDS = 1 << 20
+SEGMENT_PREFIX = "usage-"
+SEGMENT_SUFFIX = ".bin"
+FIELDS = ("cpu", "memory")
+
+
+def record_struct(fields):
+    # epoch seconds as float64, then one float32 per metric
+    return struct.Struct("<d" + "f" * len(fields))
+
+
+def record_dtype(fields):
+    import numpy as np
+    return np.dtype([("time", "<f8")] + [(name, "<f4") for name in fields])
+
+
+class MetricStore:
+    """
+    Append-only binary time series of fixed-width records, split into segment files.
+
+    Each segment is named after the timestamp of its first record, so the
+    sorted directory listing is the time index: a query binary-searches it
+    for the first segment, then binary-searches the memory-mapped records.
+    Writing only needs the struct module; reading needs NumPy.
+    """
+
+    def __init__(self, directory, fields=FIELDS, flush_rows=60, flush_seconds=10,
+                 segment_records=SEGMENT_RECORDS, read_only=False):
+        self.directory = directory
+        self.fields = tuple(fields)
+        self.record = record_struct(self.fields)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.segment_records = segment_records
+        self.pending = []
+        self.last_flush = time.monotonic()
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """
+        Returns [(start time, path)] for every segment, oldest first.
+        """
+        found = []
+        if not os.path.isdir(self.directory):
+            return found  # a reader opened before anything was written
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                start = float(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                found.append((start, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def append(self, timestamp, *values):
+        self.pending.append(self.record.pack(timestamp, *values))
+        if len(self.pending) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        while self.pending:
+            path, room = self._open_segment()
+            batch, self.pending = self.pending[:room], self.pending[room:]
+            with open(path, "ab") as f:
+                f.write(b"".join(batch))
+
+    close = flush
+
+    def _open_segment(self):
+        segments = self.segments()
+        if segments:
+            path = segments[-1][1]
+            size = os.path.getsize(path)
+            used = size // self.record.size
+            if size % self.record.size:
+                # a crash or a full disk left part of a record; appending after
+                # it would shift every later record
+                print(f"Dropping {size % self.record.size} bytes of a partial record at the end of {path}")
+                os.truncate(path, used * self.record.size)
+            if used < self.segment_records:
+                return path, self.segment_records - used
+        start = self.record.unpack(self.pending[0])[0]
+        name = f"{SEGMENT_PREFIX}{start:.6f}{SEGMENT_SUFFIX}"
+        return os.path.join(self.directory, name), self.segment_records
+
+    def prune(self, cutoff):
+        """
+        Deletes segments whose records are all older than cutoff (epoch seconds).
+        """
+        segments = self.segments()
+        for (_, path), (next_start, _) in zip(segments, segments[1:]):
+            if next_start <= cutoff:
+                os.remove(path)
+
+    def _map(self, path):
+        import numpy as np
+        dtype = record_dtype(self.fields)
+        count = os.path.getsize(path) // dtype.itemsize
+        if not count:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def query(self, start=None, end=None):
+        """
+        Returns the records with start <= time < end as a NumPy structured array.
+
+        A range inside one segment is a zero-copy view of the mapped file; a
+        range spanning segments is concatenated.
+        """
+        import numpy as np
+        segments = self.segments()
+        starts = [s for s, _ in segments]
+        first = max(bisect.bisect_right(starts, start) - 1, 0) if start is not None else 0
+        last = bisect.bisect_left(starts, end) if end is not None else len(segments)
+        parts = []
+        for _, path in segments[first:last]:
+            records = self._map(path)
+            lo = np.searchsorted(records["time"], start, "left") if start is not None else 0
+            hi = np.searchsorted(records["time"], end, "left") if end is not None else len(records)
+            if hi > lo:
+                parts.append(records[lo:hi])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=record_dtype(self.fields))
+
+    def last(self, seconds):
+        return self.query(time.time() - seconds)
+
+    def export_csv(self, out, start=None, end=None):
+        """
+        Writes records as the timestamp,cpu,memory rows of the CSV usage log.
+        """
+        writer = csv.writer(out)
+        records = self.query(start, end)
+        for row in records.tolist():
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[0]))
+            writer.writerow([timestamp] + [round(value, 2) for value in row[1:]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export resource_manager's binary usage store as CSV.")
+    parser.add_argument("directory")
+    parser.add_argument("--hours", type=float, help="only export the last N hours")
+    args = parser.parse_args()
+    start = time.time() - args.hours * 3600 if args.hours else None
+    MetricStore(args.directory).export_csv(sys.stdout, start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import collections
+import heapq
+import math
+import os
+import time
+
+import instrument
+
+psutil = instrument.lazy_import('psutil')
+
+CRITERIA = ('cpu_percent', 'memory_percent')
+MIN_PID = 500
+ROUNDS = 10
+# shortest interval a fresh cpu_percent() reading is trusted over the sampled one
+MIN_CPU_SECONDS = 0.5
+
+
+class ProcessIndex:
+    """
+    Keeps psutil.Process objects for every running process and max-heaps of
+    their CPU and memory usage, updated a slice at a time.
+
+    refresh() only creates objects for PIDs that appeared since the last call
+    and drops the ones that exited. A new process gets its CPU baseline when
+    it is found and is read and ranked in the next refresh. Of the others,
+    only the 1/rounds that were read longest ago are read again, so a refresh
+    costs n/rounds process reads and every process is re-read every rounds
+    refreshes; cpu_percent() then covers the whole time since its last read.
+    Processes that used no CPU are left out of the CPU heap, so top() never
+    picks an idle process by PID order.
+
+    The heaps keep superseded entries, which top() skips. A candidate is
+    re-read before it is returned, memory always and CPU when its last read is
+    at least MIN_CPU_SECONDS old, and pushed back if it is no longer the
+    largest.
+    """
+
+    def __init__(self, rounds=ROUNDS):
+        self.rounds = rounds
+        self.processes = {}
+        self.new = set()  # primed, not read yet
+        self.rotation = collections.deque()  # read PIDs, least recently read first
+        self.read_at = {}
+        self.values = {criteria: {} for criteria in CRITERIA}
+        self.heaps = {criteria: [] for criteria in CRITERIA}
+
+    def refresh(self):
+        pids = set(psutil.pids())
+        for pid in set(self.processes) - pids:
+            self._forget(pid)
+
+        due = list(self.new)
+        self.new = set()
+        for _ in range(min(math.ceil(len(self.rotation) / self.rounds), len(self.rotation))):
+            pid = self.rotation.popleft()
+            if pid in self.processes:
+                due.append(pid)
+        for pid in due:
+            try:
+                with self.processes[pid].oneshot():
+                    self._update(pid, 'cpu_percent', self.processes[pid].cpu_percent(None))
+                    self._update(pid, 'memory_percent', self.processes[pid].memory_percent())
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._forget(pid)
+                continue
+            self.read_at[pid] = time.monotonic()
+            self.rotation.append(pid)
+        instrument.count("processes read", len(due))
+
+        for pid in pids - set(self.processes):
+            if not self._eligible(pid):
+                continue
+            try:
+                process = psutil.Process(pid)
+                process.cpu_percent(None)  # baseline for the next reading
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            self.processes[pid] = process
+            self.new.add(pid)
+
+        for criteria, heap in self.heaps.items():
+            if len(heap) > 2 * len(self.values[criteria]) + 64:
+                # drop the superseded entries once they outnumber the live ones
+                heap[:] = [(-value, pid) for pid, value in self.values[criteria].items()]
+                heapq.heapify(heap)
+
+    def _update(self, pid, criteria, value, push=True):
+        if criteria == 'cpu_percent' and not value:
+            self.values[criteria].pop(pid, None)
+            return
+        if self.values[criteria].get(pid) != value:
+            self.values[criteria][pid] = value
+            if push:
+                heapq.heappush(self.heaps[criteria], (-value, pid))
+
+    def _forget(self, pid):
+        self.processes.pop(pid, None)
+        self.new.discard(pid)
+        self.read_at.pop(pid, None)
+        for values in self.values.values():
+            values.pop(pid, None)
+
+    def _eligible(self, pid):
+        return pid >= MIN_PID and pid != os.getpid()
+
+    def _current(self, process, criteria, sampled):
+        with process.oneshot():
+            if process.status() == psutil.STATUS_STOPPED:
+                return None
+            if criteria == 'memory_percent':
+                return process.memory_percent()
+            if time.monotonic() - self.read_at.get(process.pid, 0) >= MIN_CPU_SECONDS:
+                self.read_at[process.pid] = time.monotonic()
+                return process.cpu_percent(None)
+            return sampled
+
+    def top(self, criteria, k=1):
+        """
+        Returns up to k running, not stopped processes with the highest usage.
+
+        Each returned process has an info dict with pid, name and the criteria
+        value, like the objects psutil.process_iter yields.
+        """
+        heap = self.heaps[criteria]
+        values = self.values[criteria]
+        found = []
+        while heap and len(found) < k:
+            sampled, pid = heapq.heappop(heap)
+            process = self.processes.get(pid)
+            if process is None or values.get(pid) != -sampled:
+                continue  # exited or superseded by a later reading
+            try:
+                value = self._current(process, criteria, -sampled)
+                if value is None:
+                    continue
+                if value != -sampled:
+                    if heap and value < -heap[0][0]:
+                        self._update(pid, criteria, value)
+                        continue
+                    self._update(pid, criteria, value, push=False)
+                process.info = {'pid': pid, 'name': process.name(), criteria: value}
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._forget(pid)
+                continue
+            found.append(process)
+        for process in found:
+            value = process.info[criteria]
+            if values.get(process.pid) == value:
+                heapq.heappush(heap, (-value, process.pid))
+        return found
@@ -1,41 +1,182 @@
 #!/usr/bin/python3
-import psutil
+import argparse
 import time
-import csv
 import os
 import subprocess
 import json
+import signal
+import sys
+from usage_writer import BufferedCSVWriter
+from process_index import ProcessIndex
+from metric_store import MetricStore
+from workload_collector import WorkloadCollector
+from rollup import Rollup, RESOLUTIONS
+from detector import Detector, Throttler
+import instrument
+
+# only imported once monitoring starts, so --help does not wait for it
+psutil = instrument.lazy_import("psutil")
 
 last_message_time = 0
 
 COOLDOWN = 30
 THRESHOLD_CPU = 80
 THRESHOLD_MEMORY = 80
+DETECTOR = "threshold"  # "threshold" or "predictive"
+EWMA_ALPHA = 0.3
+SUSTAIN_SECONDS = 10
+MEMORY_HORIZON = 60
 PATH = "/var/log/resource_manager"
 SUSPEND_LOG_PATH = PATH + "/suspend_log.csv"
 USAGE_LOG_PATH = PATH + "/usage.csv"
 RUN_INTERVAL = 1
+STORAGE_FORMAT = "csv"  # "csv", "binary" or "both"
+BINARY_STORE_PATH = PATH + "/usage.d"
+ROLLUP_ENABLED = False
+ROLLUP_PATH = PATH + "/rollup"
+ROLLUP_RETENTION = RESOLUTIONS
+PRINT_INTERVAL = 1
+LOG_FLUSH_ROWS = 60
+LOG_FLUSH_SECONDS = 10
+LOG_ROTATE_BYTES = 50 * 1024 * 1024
+LOG_ROTATE_SECONDS = 0
+LOG_COMPRESS = True
+LOG_KEEP = 10
+PROCESS_INDEX_INTERVAL = 1
+PROCESS_INDEX_ROUNDS = 10
+SUSPEND_COUNT = 1
+WORKLOAD_COLLECTOR = "off"  # "off", "process" or "cgroup"
+WORKLOAD_INTERVAL = 5
+WORKLOAD_TOP_K = 10
+WORKLOAD_LOG_PATH = PATH + "/workloads.csv"
+
+usage_writer = None
+suspend_writer = None
+metric_store = None
+workload_writer = None
+rollup = None
+process_index = None
+throttler = None
 
 CONFIG_PATH = "/etc/resource_manager/config.json"
 
+def open_log_writers():
+    global usage_writer, suspend_writer, metric_store, workload_writer, rollup
+    options = dict(rotate_bytes=LOG_ROTATE_BYTES, rotate_seconds=LOG_ROTATE_SECONDS,
+                   compress=LOG_COMPRESS, keep=LOG_KEEP)
+    if STORAGE_FORMAT in ("csv", "both"):
+        usage_writer = BufferedCSVWriter(USAGE_LOG_PATH, LOG_FLUSH_ROWS, LOG_FLUSH_SECONDS, **options)
+    if STORAGE_FORMAT in ("binary", "both"):
+        metric_store = MetricStore(BINARY_STORE_PATH, flush_rows=LOG_FLUSH_ROWS, flush_seconds=LOG_FLUSH_SECONDS)
+    # suspensions are rare and matter most, so they are written straight away
+    suspend_writer = BufferedCSVWriter(SUSPEND_LOG_PATH, 1, 0, **options)
+    if ROLLUP_ENABLED:
+        rollup = Rollup(ROLLUP_PATH, resolutions=ROLLUP_RETENTION,
+                        flush_rows=LOG_FLUSH_ROWS, flush_seconds=LOG_FLUSH_SECONDS)
+    if WORKLOAD_COLLECTOR != "off":
+        workload_writer = BufferedCSVWriter(WORKLOAD_LOG_PATH, LOG_FLUSH_ROWS, LOG_FLUSH_SECONDS, **options)
+
+def close_log_writers():
+    for writer in (usage_writer, suspend_writer, metric_store, workload_writer, rollup):
+        if writer:
+            writer.close()
+
 def main():
-    while True:
-        cpu_usage, memory_usage = get_status()
-        store_usage(cpu_usage, memory_usage)
+    psutil.cpu_percent(interval=None)  # first call only sets the baseline for the deltas
+    overhead = OverheadMeter()
+    last_print = 0
+    last_index = 0
+    last_workloads = 0
+    collector = WorkloadCollector(WORKLOAD_COLLECTOR, WORKLOAD_TOP_K) if WORKLOAD_COLLECTOR != "off" else None
+    detector = None
+    if DETECTOR == "predictive":
+        detector = Detector(THRESHOLD_CPU, THRESHOLD_MEMORY, EWMA_ALPHA, SUSTAIN_SECONDS, MEMORY_HORIZON)
+    for now in ticks(RUN_INTERVAL):
+        if now - last_index >= PROCESS_INDEX_INTERVAL:
+            last_index = now
+            with instrument.timed("process index"):
+                process_index.refresh()
+        if collector and now - last_workloads >= WORKLOAD_INTERVAL:
+            last_workloads = now
+            with instrument.timed("workloads"):
+                store_workloads(collector.sample())
+
+        with instrument.timed("sample"):
+            cpu_usage, memory_usage = get_status()
+        instrument.count("samples taken")
+        with instrument.timed("store"):
+            store_usage(cpu_usage, memory_usage)
         
-        print(f"CPU Usage: {cpu_usage}%")
-        print(f"Memory Usage: {memory_usage}%")
+        if now - last_print >= PRINT_INTERVAL:
+            last_print = now
+            print(f"CPU Usage: {cpu_usage}%")
+            print(f"Memory Usage: {memory_usage}%")
+            print(f"Monitor overhead: {overhead.percent():.2f}% CPU")
         
-        if (has_crossed_threshold(cpu_usage, memory_usage)):
+        if detector:
+            timestamp = time.time()
+            with instrument.timed("detect"):
+                action, resource, level = detector.update(timestamp, cpu_usage, memory_usage)
+            if action:
+                send_message(cpu_usage, memory_usage)
+                act_on_processes(action, resource, level)
+            elif throttler.throttled and detector.is_calm(timestamp):
+                throttler.release_all()
+        elif (has_crossed_threshold(cpu_usage, memory_usage)):
             send_message(cpu_usage, memory_usage)
             suspend_processes(cpu_usage, memory_usage)
 
-        time.sleep(RUN_INTERVAL) 
+def ticks(interval):
+    """
+    Yields once per interval on a fixed schedule, so the time spent sampling
+    does not push later samples back. If the loop falls more than a whole
+    interval behind, the schedule restarts from now instead of bursting.
+    """
+    next_tick = time.monotonic()
+    while True:
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > interval:
+            next_tick = time.monotonic()
+        yield next_tick
+
+class OverheadMeter:
+    """
+    CPU time used by this process as a share of wall time since the last reading.
+    """
+    def __init__(self):
+        self.cpu = time.process_time()
+        self.wall = time.monotonic()
+
+    def percent(self):
+        cpu, wall = time.process_time(), time.monotonic()
+        used = (cpu - self.cpu) / (wall - self.wall) * 100 if wall > self.wall else 0.0
+        self.cpu, self.wall = cpu, wall
+        return used
 
 def suspend_processes(cpu_usage, memory_usage): 
-    process = get_highest_process('cpu' if has_crossed_threshold_cpu(cpu_usage) else 'mem')
-    status = stop_process(process, has_crossed_threshold_mem(memory_usage))
-    store_suspend_log(process, status, has_crossed_threshold_mem(memory_usage))
+    kill = has_crossed_threshold_mem(memory_usage)
+    criteria = 'cpu' if has_crossed_threshold_cpu(cpu_usage) else 'mem'
+    for process in get_highest_processes(criteria, SUSPEND_COUNT):
+        status = stop_process(process, kill)
+        store_suspend_log(process, status, kill)
+
+def act_on_processes(action, resource, level):
+    for process in get_highest_processes(resource, SUSPEND_COUNT):
+        if action == 'throttle':
+            try:
+                note = throttler.throttle(process, resource, level)
+                status = True
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                note, status = str(e), False
+            if note:
+                store_throttle_log(process, status, note)
+        else:
+            kill = action == 'kill'
+            status = stop_process(process, kill)
+            store_suspend_log(process, status, kill)
 
 def stop_process(process, kill):
     try:
@@ -48,30 +189,25 @@ def stop_process(process, kill):
         return False   
 
 def store_suspend_log(process, status, kill):
-    with open(SUSPEND_LOG_PATH, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, process.info['pid'], process.info['name'], status, kill])
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    suspend_writer.write([timestamp, process.info['pid'], process.info['name'], status, kill])
+    instrument.count("processes killed" if kill else "processes suspended")
     
     print(f"Suspended process: {process.info['name']} (PID: {process.info['pid']}) (Success: {status}) (Kill: {kill})")
 
+def store_throttle_log(process, status, note):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    suspend_writer.write([timestamp, process.info['pid'], process.info['name'], status, f"throttle {note}"])
+    instrument.count("processes throttled")
+    print(f"Throttled process: {process.info['name']} (PID: {process.info['pid']}) (Success: {status}) ({note})")
+
 def get_highest_process(criteria):
-    proc_max = None
+    processes = get_highest_processes(criteria, 1)
+    return processes[0] if processes else None
+
+def get_highest_processes(criteria, k):
     criteria = 'cpu_percent' if criteria == 'cpu' else 'memory_percent'
-    
-    processes = psutil.process_iter(attrs=['pid', 'name', 'status', criteria])
-    for process in processes:
-        try:
-            if process.info['status'] == psutil.STATUS_STOPPED or process.info['pid'] == os.getpid() or process.info['pid'] < 500:
-                continue
-            
-            proc_max = process if proc_max is None else proc_max
-            if process.info[criteria] > proc_max.info[criteria]:
-                proc_max = process
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    
-    return proc_max
+    return process_index.top(criteria, k)
     
 def send_message(cpu_usage, memory_usage):
     global last_message_time
@@ -101,18 +237,31 @@ def has_crossed_threshold_mem(memory_usage) -> bool:
     return memory_usage > THRESHOLD_MEMORY
 
 def get_status():
-    cpu_usage = psutil.cpu_percent(interval=1)
+    # non-blocking: utilisation since the previous call, i.e. over the last tick
+    cpu_usage = psutil.cpu_percent(interval=None)
     memory_usage = psutil.virtual_memory().percent
     
     return cpu_usage, memory_usage
 
+def store_workloads(rows):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    for row in rows:
+        workload_writer.write([timestamp, WORKLOAD_COLLECTOR, *row])
+
 def store_usage(cpu_usage, memory_usage):
-    with open(USAGE_LOG_PATH, mode='a', newline='') as file:
-        writer = csv.writer(file)
+    if usage_writer:
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, cpu_usage, memory_usage])
+        usage_writer.write([timestamp, cpu_usage, memory_usage])
+    if metric_store:
+        metric_store.append(time.time(), cpu_usage, memory_usage)
+    if rollup:
+        rollup.add(time.time(), cpu_usage, memory_usage)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Log CPU and memory usage and stop the processes using too much; "
+                                                 f"settings are read from {CONFIG_PATH}.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
     try:
         with open(CONFIG_PATH, 'r') as f:
             config = json.load(f)
@@ -123,4 +272,17 @@ if __name__ == "__main__":
     except json.JSONDecodeError:
         print("Error reading config file, using default values.")
     os.makedirs(PATH, exist_ok=True)
-    main()
\ No newline at end of file
+    # systemd stops the service with SIGTERM; exit normally so buffered rows get flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    open_log_writers()
+    process_index = ProcessIndex(PROCESS_INDEX_ROUNDS)
+    if DETECTOR == "predictive":
+        # sets up the cgroup, so only when it can be used
+        throttler = Throttler()
+    instrument.start(args.stats, args.profile)
+    try:
+        main()
+    finally:
+        if throttler:
+            throttler.release_all()
+        close_log_writers()
\ No newline at end of file
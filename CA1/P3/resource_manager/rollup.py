@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+from metric_store import MetricStore
+
+# resolution in seconds -> retention in seconds
+RESOLUTIONS = {1: 2 * 86400, 60: 30 * 86400, 3600: 365 * 86400}
+METRICS = ("cpu", "memory")
+STATS = ("min", "max", "avg", "p95")
+MIN_POINTS = 500
+PRUNE_INTERVAL = 3600
+# segments per retention span; pruning drops whole segments, so data is kept
+# up to one segment (retention / SEGMENTS_PER_RETENTION) longer than asked
+SEGMENTS_PER_RETENTION = 8
+# samples of the buckets still open at close(), reloaded by the next Rollup
+OPEN_BUCKETS = "open-buckets.json"
+
+
+def percentile(values, q):
+    # nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class Rollup:
+    """
+    Keeps min/max/avg/p95 aggregates of each metric at several resolutions.
+
+    Samples go into the open bucket of every resolution; when a sample lands
+    in a later bucket the open one is summarised and appended to that
+    resolution's MetricStore. Each resolution drops segments older than its
+    retention. The samples of the open buckets are kept in a file at close()
+    and picked up again on restart, so a bucket is stored once and complete.
+
+    With read_only set it only answers queries: it creates no directories
+    and leaves the open buckets' file to the writer.
+    """
+
+    def __init__(self, directory, metrics=METRICS, resolutions=RESOLUTIONS, flush_rows=60, flush_seconds=10,
+                 read_only=False):
+        self.metrics = tuple(metrics)
+        self.fields = [f"{metric}_{stat}" for metric in self.metrics for stat in STATS]
+        self.resolutions = {int(res): retention for res, retention in resolutions.items()}
+        self.stores = {
+            res: MetricStore(os.path.join(directory, f"{res}s"), self.fields, flush_rows, flush_seconds,
+                             segment_records=max(retention // res // SEGMENTS_PER_RETENTION, 1),
+                             read_only=read_only)
+            for res, retention in self.resolutions.items()
+        }
+        self.read_only = read_only
+        self.open_path = os.path.join(directory, OPEN_BUCKETS)
+        self.buckets = {res: (None, [[] for _ in self.metrics]) for res in self.resolutions}
+        if not read_only:
+            self._load_open_buckets()
+        self.last_prune = {res: 0 for res in self.resolutions}
+
+    def add(self, timestamp, *values):
+        for res in self.resolutions:
+            index, samples = self.buckets[res]
+            current = int(timestamp // res)
+            if index != current:
+                if index is not None:
+                    self._close(res, index, samples)
+                samples = [[] for _ in self.metrics]
+                self.buckets[res] = (current, samples)
+            for column, value in zip(samples, values):
+                column.append(value)
+
+    def _close(self, res, index, samples):
+        if not samples[0]:
+            return
+        row = []
+        for column in samples:
+            row += [min(column), max(column), sum(column) / len(column), percentile(column, 0.95)]
+        store = self.stores[res]
+        store.append(index * res, *row)
+        now = time.time()
+        if now - self.last_prune[res] >= PRUNE_INTERVAL:
+            self.last_prune[res] = now
+            store.prune(now - self.resolutions[res])
+
+    def _load_open_buckets(self):
+        try:
+            with open(self.open_path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring open rollup buckets in {self.open_path}: {e}")
+            saved = {}
+        for res, (index, samples) in saved.items():
+            if int(res) in self.buckets and len(samples) == len(self.metrics):
+                self.buckets[int(res)] = (index, samples)
+        # removed at once, so a crash before the next close() cannot store the samples twice
+        os.remove(self.open_path)
+
+    def close(self):
+        if self.read_only:
+            return
+        # the open buckets are partial: keep their samples for the next run
+        # instead of storing a row that the next run would store again
+        saved = {res: [index, samples] for res, (index, samples) in self.buckets.items() if index is not None}
+        if saved:
+            temporary = self.open_path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(saved, f)
+            os.replace(temporary, self.open_path)
+        for store in self.stores.values():
+            store.close()
+
+    def resolution_for(self, start, end, min_points=MIN_POINTS):
+        """
+        Picks the coarsest resolution that still gives min_points over the
+        span and whose retention reaches back to start.
+        """
+        span = end - start
+        reaching = [res for res, retention in self.resolutions.items() if time.time() - start <= retention]
+        candidates = reaching or list(self.resolutions)
+        detailed = [res for res in candidates if span / res >= min_points]
+        return max(detailed) if detailed else min(candidates)
+
+    def query(self, start, end=None, min_points=MIN_POINTS):
+        """
+        Returns (resolution, records) for start <= time < end from the
+        resolution chosen by resolution_for.
+        """
+        end = time.time() if end is None else end
+        res = self.resolution_for(start, end, min_points)
+        return res, self.stores[res].query(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print resource_manager rollups for a time span as CSV.")
+    parser.add_argument("directory")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--min-points", type=int, default=MIN_POINTS)
+    args = parser.parse_args()
+    rollup = Rollup(args.directory, read_only=True)
+    res, records = rollup.query(time.time() - args.hours * 3600, min_points=args.min_points)
+    print(f"# resolution {res}s", file=sys.stderr)
+    print(",".join(["timestamp"] + rollup.fields))
+    for row in records.tolist():
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[0]))
+        print(",".join([timestamp] + [f"{value:.2f}" for value in row[1:]]))
+
+
+if __name__ == "__main__":
+    main()
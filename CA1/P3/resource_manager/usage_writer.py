@@ -0,0 +1,88 @@
+import csv
+import glob
+import gzip
+import os
+import shutil
+import time
+
+# resource_manager starts every row with the time it was logged
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class BufferedCSVWriter:
+    """
+    Appends CSV rows to a log file in batches and rotates it.
+
+    Rows are kept in memory until flush_rows of them are pending or
+    flush_seconds have passed since the last flush, then written with one
+    write call. After a flush the file is rotated once it is larger than
+    rotate_bytes or older than rotate_seconds (0 disables either check);
+    rotated segments are optionally gzipped and only the newest keep are kept.
+    Rotated segments are named after the rotation time down to the
+    microsecond, so the names never collide and sort oldest first. The age
+    of a file written before a restart is taken from the timestamp its first
+    row starts with.
+    """
+
+    def __init__(self, path, flush_rows=60, flush_seconds=10, rotate_bytes=0, rotate_seconds=0,
+                 compress=True, keep=10):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.keep = keep
+        self.rows = []
+        self.last_flush = time.monotonic()
+        self.segment_started = self._segment_start()
+
+    def _segment_start(self):
+        try:
+            with open(self.path, newline='') as f:
+                first = next(csv.reader(f), None)
+        except OSError:
+            return time.time()
+        try:
+            return time.mktime(time.strptime(first[0], TIMESTAMP_FORMAT))
+        except (TypeError, IndexError, ValueError):
+            # an empty file, or rows without a timestamp: the age counts from now
+            return time.time()
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        with open(self.path, mode='a', newline='') as file:
+            csv.writer(file).writerows(self.rows)
+        self.rows = []
+        if self._should_rotate():
+            self.rotate()
+
+    close = flush
+
+    def _should_rotate(self):
+        if self.rotate_bytes and os.path.getsize(self.path) >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self.segment_started >= self.rotate_seconds
+
+    def rotate(self):
+        now = time.time()
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now % 1 * 1e6):06d}"
+        os.replace(self.path, rotated)
+        self.segment_started = now
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._prune()
+
+    def _prune(self):
+        segments = sorted(glob.glob(glob.escape(self.path) + '.[0-9]*'))
+        for old in segments[:-self.keep] if self.keep else []:
+            os.remove(old)
@@ -0,0 +1,121 @@
+import heapq
+import os
+import time
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_processes():
+    """
+    Reads {pid: (name, cpu seconds, rss bytes, read bytes, write bytes)} for all
+    processes straight from /proc. I/O counters are 0 where /proc/PID/io is
+    not readable.
+    """
+    samples = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        stat = _read(f"/proc/{entry.name}/stat")
+        if stat is None:
+            continue
+        # comm may contain spaces and parentheses, so split after the last ')'
+        name_end = stat.rfind(b")")
+        name = stat[stat.find(b"(") + 1:name_end].decode(errors="replace")
+        fields = stat[name_end + 2:].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+        rss = int(fields[21]) * PAGE_SIZE
+        read_bytes = write_bytes = 0
+        io = _read(f"/proc/{entry.name}/io")
+        if io:
+            for line in io.splitlines():
+                key, _, value = line.partition(b":")
+                if key == b"read_bytes":
+                    read_bytes = int(value)
+                elif key == b"write_bytes":
+                    write_bytes = int(value)
+        samples[int(entry.name)] = (name, cpu, rss, read_bytes, write_bytes)
+    return samples
+
+
+def read_cgroups(root=CGROUP_ROOT):
+    """
+    Reads the same tuple as read_processes for every cgroup v2 group, keyed by
+    its path relative to root.
+    """
+    samples = {}
+    for path, _, files in os.walk(root):
+        if "cpu.stat" not in files:
+            continue
+        cpu = 0.0
+        for line in (_read(os.path.join(path, "cpu.stat")) or b"").splitlines():
+            if line.startswith(b"usage_usec "):
+                cpu = int(line.split()[1]) / 1e6
+        memory = _read(os.path.join(path, "memory.current"))
+        read_bytes = write_bytes = 0
+        for line in (_read(os.path.join(path, "io.stat")) or b"").splitlines():
+            for item in line.split()[1:]:
+                key, _, value = item.partition(b"=")
+                if key == b"rbytes":
+                    read_bytes += int(value)
+                elif key == b"wbytes":
+                    write_bytes += int(value)
+        name = "/" + os.path.relpath(path, root) if path != root else "/"
+        samples[name] = (name, cpu, int(memory) if memory else 0, read_bytes, write_bytes)
+    return samples
+
+
+class WorkloadCollector:
+    """
+    Samples per-process or per-cgroup CPU, RSS and I/O and keeps the top-K.
+
+    Every sample is a bulk read of the kernel counters; CPU and I/O rates
+    come from the difference with the previous sample. Only the k largest
+    CPU users and the k largest memory users are returned.
+    """
+
+    def __init__(self, mode="process", k=10):
+        self.read = read_cgroups if mode == "cgroup" else read_processes
+        self.mode = mode
+        self.k = k
+        self.previous = None
+        self.previous_time = None
+
+    def sample(self):
+        """
+        Returns rows of (id, name, cpu %, rss bytes, read bytes/s, write bytes/s).
+        """
+        now = time.monotonic()
+        current = self.read()
+        previous, elapsed = self.previous, now - (self.previous_time or now)
+        self.previous, self.previous_time = current, now
+        if previous is None or elapsed <= 0:
+            return []
+
+        rows = []
+        for key, (name, cpu, rss, read_bytes, write_bytes) in current.items():
+            before = previous.get(key)
+            if before is None:
+                continue
+            rows.append((
+                key, name,
+                round((cpu - before[1]) / elapsed * 100, 2),
+                rss,
+                round(max(read_bytes - before[3], 0) / elapsed),
+                round(max(write_bytes - before[4], 0) / elapsed),
+            ))
+        top_cpu = heapq.nlargest(self.k, rows, key=lambda row: row[2])
+        top_rss = heapq.nlargest(self.k, rows, key=lambda row: row[3])
+        top = {row[0]: row for row in top_cpu}
+        for row in top_rss:
+            top.setdefault(row[0], row)
+        return list(top.values())
@@ -0,0 +1,101 @@
+import asyncio
+import csv
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import paramiko
+import pytest
+
+import fleet
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "P2"))
+import local_ssh_server
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """
+    A local_ssh_server and the key it accepts, as (port, key path).
+    """
+    key = paramiko.RSAKey.generate(2048)
+    key_path = str(tmp_path_factory.mktemp("key") / "id_rsa")
+    key.write_private_key_file(key_path)
+    return local_ssh_server.start_local_server(key), key_path
+
+
+def collect(hosts, duration=1.5, interval=0.2, timeout=2, output=None):
+    collector = fleet.FleetCollector(hosts, interval, timeout, output=output, report=False)
+    # the guard turns a hang into a failure
+    asyncio.run(asyncio.wait_for(collector.run(duration), (duration or 0) + 10))
+    return collector
+
+
+def test_polls_a_host(server):
+    port, key_path = server
+    host = fleet.SSHHost("127.0.0.1", port, "test", key_filename=key_path)
+    collector = collect([host])
+    assert collector.stats["samples"] >= 2
+    assert collector.stats["errors"] == 0
+    _, cpu, memory = collector.latest[host.name]
+    assert 0 <= cpu <= 100 and 0 < memory < 100
+    assert "hosts up: 1/1" in collector.summary()
+
+
+def test_unreachable_host_is_an_error():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    host = fleet.SSHHost("127.0.0.1", port, "test", timeout=1)
+    collector = collect([host])
+    assert collector.stats["errors"] >= 1
+    assert collector.stats["samples"] == 0
+    assert host.name not in collector.latest
+
+
+def test_silent_host_times_out_without_holding_up_others(server):
+    port, key_path = server
+    # accepts the connection but never sends an SSH banner
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)
+    try:
+        stuck = fleet.SSHHost("127.0.0.1", silent.getsockname()[1], "test", timeout=2)
+        healthy = fleet.SSHHost("127.0.0.1", port, "test", key_filename=key_path)
+        collector = collect([stuck, healthy], timeout=0.5)
+    finally:
+        silent.close()
+    assert collector.stats["timeouts"] >= 1
+    assert stuck.name not in collector.latest
+    assert healthy.name in collector.latest
+
+
+def test_output_rows(server, tmp_path):
+    port, key_path = server
+    output = tmp_path / "fleet.csv"
+    subprocess.run([sys.executable, os.path.join(HERE, "fleet.py"), f"test@127.0.0.1:{port}", "--key", key_path,
+                    "--interval", "0.2", "--duration", "1.5", "--output", str(output)],
+                   check=True, capture_output=True, timeout=30)
+    with open(output, newline="") as f:
+        rows = list(csv.reader(f))
+    assert len(rows) >= 2
+    for timestamp, name, cpu, memory in rows:
+        time.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        assert name == f"127.0.0.1:{port}"
+        assert 0 <= float(cpu) <= 100 and 0 < float(memory) < 100
+
+
+def test_output_error_stops_the_run(server, tmp_path):
+    port, key_path = server
+    host = fleet.SSHHost("127.0.0.1", port, "test", key_filename=key_path)
+    with pytest.raises(IsADirectoryError):
+        collect([host], duration=None, output=str(tmp_path))
+
+
+def test_help_does_not_import_paramiko():
+    code = "import sys, fleet; print('paramiko' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -1,50 +1,211 @@
 from flask import Flask, render_template, request, make_response, g
-from redis import Redis
+from redis import ConnectionPool, Redis, RedisError
+from werkzeug.http import parse_cookie, parse_etags, quote_etag
+import atexit
+import hashlib
 import os
 import socket
 import random
 import json
 import logging
+import threading
+import time
 
 option_a = os.getenv('OPTION_A', "Girls")
 option_b = os.getenv('OPTION_B', "Boys")
 hostname = socket.gethostname()
 
+# votes pushed with one RPUSH in batching mode; 0 pushes every vote during its request
+VOTE_BATCH_SIZE = int(os.getenv('VOTE_BATCH_SIZE', '0'))
+# longest time a vote waits for its batch to fill up before it is pushed anyway
+VOTE_FLUSH_MS = float(os.getenv('VOTE_FLUSH_MS', '10'))
+# votes kept while Redis is unreachable; older ones are dropped beyond this
+MAX_PENDING_VOTES = 100000
+RETRY_SECONDS = 1
+
 app = Flask(__name__)
 
 gunicorn_error_logger = logging.getLogger('gunicorn.error')
 app.logger.handlers.extend(gunicorn_error_logger.handlers)
 app.logger.setLevel(logging.INFO)
 
+# shared by all requests of this process, so connections are reused instead of opened per request
+redis_pool = ConnectionPool(host=os.getenv('REDIS_HOST', 'redis'), port=int(os.getenv('REDIS_PORT', '6379')),
+                            db=0, socket_timeout=5)
+
 def get_redis():
     if not hasattr(g, 'redis'):
-        g.redis = Redis(host="redis", db=0, socket_timeout=5)
+        g.redis = Redis(connection_pool=redis_pool)
     return g.redis
 
+
+class VoteBatcher:
+    """
+    Pushes votes to Redis from a background thread in batches.
+
+    A vote is queued and the request returns at once. The thread waits until
+    batch_size votes are queued or the oldest has waited flush_delay
+    seconds, then sends everything queued with RPUSH commands of up to
+    batch_size votes in one pipeline, so one round trip carries many votes.
+    If Redis is unreachable the votes are queued again and retried. The
+    queue is flushed when the process exits: close() pushes until nothing
+    is queued. Votes are lost if the process is killed outright, if a push
+    fails while closing, or if more than MAX_PENDING_VOTES pile up while
+    Redis is down; the last two are logged.
+    """
+
+    def __init__(self, redis, batch_size, flush_delay):
+        self.redis = redis
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self.pending = []
+        self.condition = threading.Condition()
+        self.closing = False
+        self.thread = None
+        self.pid = None
+
+    def add(self, data):
+        with self.condition:
+            # threads do not survive a fork, so every gunicorn worker starts its own
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.pending.append(data)
+            if len(self.pending) == 1 or len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                deadline = time.monotonic() + self.flush_delay
+                while len(self.pending) < self.batch_size and not self.closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending = self.pending, []
+                if not batch:
+                    # only reached when closing: everything queued has been pushed
+                    return
+            if not self._push(batch):
+                with self.condition:
+                    self.pending[:0] = batch
+                    if len(self.pending) > MAX_PENDING_VOTES:
+                        app.logger.error('Dropped %d votes', len(self.pending) - MAX_PENDING_VOTES)
+                        del self.pending[:-MAX_PENDING_VOTES]
+                    if self.closing:
+                        app.logger.error('Lost %d votes at exit', len(self.pending))
+                        return
+                    self.condition.wait(RETRY_SECONDS)
+
+    def _push(self, batch):
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for start in range(0, len(batch), self.batch_size):
+                pipe.rpush('votes', *batch[start:start + self.batch_size])
+            pipe.execute()
+            return True
+        except RedisError as e:
+            app.logger.error('Could not push %d votes: %s', len(batch), e)
+            return False
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join()
+
+
+vote_batcher = None
+if VOTE_BATCH_SIZE > 0:
+    vote_batcher = VoteBatcher(Redis(connection_pool=redis_pool), VOTE_BATCH_SIZE, VOTE_FLUSH_MS / 1000)
+    atexit.register(vote_batcher.close)
+
+# votes whose page is rendered once per process; only the vote differs between the pages
+CACHED_VOTES = (None, 'a', 'b')
+rendered_pages = {}  # vote -> (page, ETag)
+
+def templates_reload():
+    # as Flask decides it: TEMPLATES_AUTO_RELOAD, or debug mode when that is unset
+    auto_reload = app.config['TEMPLATES_AUTO_RELOAD']
+    return app.debug if auto_reload is None else auto_reload
+
+def render_page(vote):
+    """
+    Returns the page for vote and its ETag, rendered on first use.
+
+    Pages are rendered every time while templates are reloaded, so edits
+    to the template show up as they do without the cache.
+    """
+    if vote in rendered_pages and not templates_reload():
+        return rendered_pages[vote]
+    page = render_template(
+        'index.html',
+        option_a=option_a,
+        option_b=option_b,
+        hostname=hostname,
+        vote=vote,
+    ).encode()
+    etag = hashlib.sha1(page).hexdigest()
+    if vote in CACHED_VOTES and not templates_reload():
+        rendered_pages[vote] = (page, etag)
+    return page, etag
+
 @app.route("/", methods=['POST','GET'])
 def hello():
     voter_id = request.cookies.get('voter_id')
-    if not voter_id:
-        voter_id = hex(random.getrandbits(64))[2:-1]
+    new_voter = not voter_id
+    if new_voter:
+        voter_id = '%016x' % random.getrandbits(64)
 
     vote = None
 
     if request.method == 'POST':
-        redis = get_redis()
         vote = request.form['vote']
         app.logger.info('Received vote for %s', vote)
         data = json.dumps({'voter_id': voter_id, 'vote': vote})
-        redis.rpush('votes', data)
+        if vote_batcher:
+            vote_batcher.add(data)
+        else:
+            get_redis().rpush('votes', data)
 
-    resp = make_response(render_template(
-        'index.html',
-        option_a=option_a,
-        option_b=option_b,
-        hostname=hostname,
-        vote=vote,
-    ))
-    resp.set_cookie('voter_id', voter_id)
-    return resp
+    page, etag = render_page(vote)
+    resp = make_response(page)
+    resp.set_etag(etag)
+    # browsers revalidate every time and get a 304 while the page is unchanged
+    resp.headers['Cache-Control'] = 'no-cache'
+    if new_voter:
+        resp.set_cookie('voter_id', voter_id)
+    return resp.make_conditional(request)
+
+
+def serve_cached_page(wsgi_app):
+    """
+    Answers a returning voter's GET of the page straight from the rendered
+    page, without a Flask request; everything else goes to wsgi_app.
+    """
+    def handle(environ, start_response):
+        cached = rendered_pages.get(None)
+        if (cached is None or templates_reload() or environ['REQUEST_METHOD'] != 'GET' or environ.get('PATH_INFO') != '/'
+                or not parse_cookie(environ.get('HTTP_COOKIE', '')).get('voter_id')):
+            return wsgi_app(environ, start_response)
+        page, etag = cached
+        headers = [('ETag', quote_etag(etag)), ('Cache-Control', 'no-cache')]
+        # GET uses the weak comparison, so W/"..." and * match as in make_conditional
+        if parse_etags(environ.get('HTTP_IF_NONE_MATCH')).contains_weak(etag):
+            start_response('304 NOT MODIFIED', headers)
+            return []
+        start_response('200 OK', [('Content-Type', 'text/html; charset=utf-8'),
+                                  ('Content-Length', str(len(page)))] + headers)
+        return [page]
+    return handle
+
+
+app.wsgi_app = serve_cached_page(app.wsgi_app)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+import loadtest
+
+VERSIONS = ("render", "cached")
+SCENARIOS = ("new visitor", "returning", "revalidate", "vote")
+
+
+def create_app(version):
+    """
+    Returns the vote app for gunicorn, with the page rendered on every request for version "render".
+    """
+    import app as vote
+    from flask import make_response, render_template, request
+    vote.app.logger.setLevel("WARNING")
+    if version == "render":
+        def hello():
+            # the view as it was before the rendered pages were cached
+            voter_id = request.cookies.get('voter_id')
+            if not voter_id:
+                voter_id = hex(random.getrandbits(64))[2:-1]
+            vote_value = None
+            if request.method == 'POST':
+                vote_value = request.form['vote']
+                vote.get_redis().rpush('votes', json.dumps({'voter_id': voter_id, 'vote': vote_value}))
+            resp = make_response(render_template('index.html', option_a=vote.option_a, option_b=vote.option_b,
+                                                 hostname=vote.hostname, vote=vote_value))
+            resp.set_cookie('voter_id', voter_id)
+            return resp
+        # rendered_pages stays empty, so the cached page is never served either
+        vote.app.view_functions['hello'] = hello
+    return vote.app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request_once(port, scenario, etag):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {} if scenario == "new visitor" else {"Cookie": "voter_id=0123456789abcdef"}
+    if scenario == "revalidate" and etag:
+        headers["If-None-Match"] = etag
+    if scenario == "vote":
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+        conn.request("POST", "/", body="vote=a", headers=headers)
+    else:
+        conn.request("GET", "/", headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    assert response.status in (200, 304), response.status
+    return response.getheader("ETag")
+
+
+def measure(port, worker, scenario, seconds, concurrency):
+    """
+    Sends scenario requests for seconds and counts them.
+
+    Returns:
+        tuple: (requests per second, worker CPU milliseconds per request).
+    """
+    etag = request_once(port, "returning", None)
+    stop = time.monotonic() + seconds
+    counts = []
+
+    def client():
+        count = 0
+        while time.monotonic() < stop:
+            request_once(port, scenario, etag)
+            count += 1
+        counts.append(count)
+
+    cpu = worker.cpu_times()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = worker.cpu_times()
+    used = after.user + after.system - cpu.user - cpu.system
+    total = sum(counts)
+    return total / elapsed, used / total * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what one gunicorn sync worker serves with and without the cached pages.")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    host, redis_port = loadtest.start_stand_in()
+    env = dict(os.environ, REDIS_HOST=host, REDIS_PORT=str(redis_port))
+    results = {}
+    for version in VERSIONS:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", f"bench_workers:create_app('{version}')",
+                                   "-b", f"127.0.0.1:{port}", "--workers", "1", "--keep-alive", "0",
+                                   "--log-level", "warning"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            for _ in range(100):
+                try:
+                    request_once(port, "returning", None)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            worker, = psutil.Process(server.pid).children()
+            for scenario in SCENARIOS:
+                results[version, scenario] = measure(port, worker, scenario, args.seconds, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"one gunicorn sync worker, {args.concurrency} clients, {args.seconds:.0f}s per scenario\n")
+    print(f"{'scenario':<12} {'render req/s':>13} {'cached req/s':>13} {'render CPU ms':>14} {'cached CPU ms':>14} {'gain':>6}")
+    for scenario in SCENARIOS:
+        (before_rate, before_cpu), (after_rate, after_cpu) = results["render", scenario], results["cached", scenario]
+        print(f"{scenario:<12} {before_rate:13.0f} {after_rate:13.0f} {before_cpu:14.2f} {after_cpu:14.2f} "
+              f"{before_cpu / after_cpu:5.1f}x")
+    print("\nCPU ms is worker CPU time per request; 1000 / CPU ms is what a worker serves on a dedicated core.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import logging
+import os
+import threading
+import time
+
+from redis import Redis
+
+MODES = ("per-request", "pooled", "batched")
+
+
+def start_stand_in():
+    """
+    Runs fakeredis as a TCP server on a free localhost port, in place of a real Redis.
+
+    Returns:
+        tuple: (host, port) it listens on.
+    """
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", 0))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[:2]
+
+
+def run_load(flask_app, requests, concurrency, post_share):
+    """
+    Sends requests to flask_app from concurrency threads, each with its own cookie.
+
+    Returns:
+        tuple: (seconds taken, sorted request latencies in seconds, votes posted).
+    """
+    latencies = []
+    posted = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = flask_app.test_client()
+        mine = []
+        votes = 0
+        for i in counter:
+            start = time.perf_counter()
+            if i % 100 < post_share * 100:
+                response = client.post("/", data={"vote": "a" if i % 2 else "b"})
+                votes += 1
+            else:
+                response = client.get("/")
+            mine.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        with lock:
+            latencies.extend(mine)
+            posted[0] += votes
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), posted[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the vote app against a local Redis or a fakeredis stand-in.")
+    parser.add_argument("--redis", help="host:port of a running Redis; a fakeredis server is started if omitted")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--post-share", type=float, default=0.5, help="share of requests that are votes")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-ms", type=float, default=10)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    if args.redis:
+        host, _, port = args.redis.partition(":")
+        port = int(port or 6379)
+    else:
+        host, port = start_stand_in()
+    # app reads these when it is imported
+    os.environ["REDIS_HOST"], os.environ["REDIS_PORT"] = host, str(port)
+    import app as vote
+    # a log line per vote would be most of what is measured
+    vote.app.logger.setLevel(logging.WARNING)
+
+    redis = Redis(connection_pool=vote.redis_pool)
+    print(f"Redis at {host}:{port}, {args.requests} requests, {args.concurrency} threads, "
+          f"{args.post_share:.0%} votes\n")
+    print(f"{'mode':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'votes':>14}")
+    for mode in args.modes:
+        redis.delete("votes")
+        get_redis = vote.get_redis
+        if mode == "per-request":
+            # what get_redis did before the shared pool: a new client and connection per request
+            vote.get_redis = lambda: Redis(host=host, port=port, db=0, socket_timeout=5)
+        elif mode == "batched":
+            vote.vote_batcher = vote.VoteBatcher(redis, args.batch_size, args.flush_ms / 1000)
+        try:
+            seconds, latencies, posted = run_load(vote.app, args.requests, args.concurrency, args.post_share)
+        finally:
+            if vote.vote_batcher:
+                vote.vote_batcher.close()
+            vote.vote_batcher = None
+            vote.get_redis = get_redis
+        stored = redis.llen("votes")
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+        print(f"{mode:<12} {len(latencies) / seconds:8.0f} {p50:8.2f} {p99:8.2f} {f'{stored}/{posted}':>14}")
+    redis.delete("votes")
+
+
+if __name__ == "__main__":
+    main()
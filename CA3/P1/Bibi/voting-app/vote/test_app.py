@@ -0,0 +1,33 @@
+import threading
+
+import fakeredis
+
+import app as vote
+
+THREADS = 16
+VOTES_PER_THREAD = 300
+
+
+def add_votes(batcher):
+    def worker(n):
+        for i in range(VOTES_PER_THREAD):
+            batcher.add(f'{{"voter_id": "{n}-{i}", "vote": "a"}}')
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_close_pushes_every_queued_vote():
+    for _ in range(30):
+        redis = fakeredis.FakeRedis()
+        batcher = vote.VoteBatcher(redis, batch_size=100, flush_delay=0.01)
+        add_votes(batcher)
+        batcher.close()
+        assert redis.llen('votes') == THREADS * VOTES_PER_THREAD
+
+
+def test_close_without_votes_returns():
+    batcher = vote.VoteBatcher(fakeredis.FakeRedis(), batch_size=100, flush_delay=0.01)
+    batcher.close()
@@ -0,0 +1,118 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import resource
+import subprocess
+import time
+
+import main as scanner
+import traffic_gen
+from raw_pcap import RawCapture, count_S_SA_raw
+
+HISTORY_PATH = "bench_history.json"
+REGRESSION = 0.10  # slowdown relative to the previous run that gets flagged
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(results, name, packets, func, *args):
+    """
+    Runs one stage, records its wall time, packets/sec and the peak RSS so far.
+    """
+    start = time.perf_counter()
+    value = func(*args)
+    elapsed = time.perf_counter() - start
+    results[name] = {
+        "seconds": round(elapsed, 4),
+        "packets_per_sec": round(packets / elapsed) if elapsed > 0 else None,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    print(f"{name:>22} {elapsed:>9.3f}s {results[name]['packets_per_sec'] or 0:>12} pkt/s "
+          f"{results[name]['peak_rss_kb'] // 1024:>7} MiB")
+    return value
+
+
+def display_quietly(suspicious_list):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        scanner.display_suspicious_ips(suspicious_list)
+
+
+def count_records(pcap_file):
+    with RawCapture(pcap_file) as capture:
+        return sum(1 for _ in capture.iter_records())
+
+
+def run_suite(pcap_file, skip_scapy=False):
+    packets = count_records(pcap_file)
+    results = {}
+    if not skip_scapy:
+        from scapy.all import rdpcap
+
+        all_packets = run_stage(results, "read", packets, rdpcap, pcap_file)
+        valid = run_stage(results, "validate_layer", packets,
+                          lambda: [p for p in all_packets if scanner.validate_layer(p)])
+        run_stage(results, "count_S_SA", packets, scanner.count_S_SA, valid)
+        del all_packets, valid
+    syn_c, synack_c, _, _ = run_stage(results, "count_S_SA_raw", packets, count_S_SA_raw, pcap_file)
+    suspicious = run_stage(results, "find_suspicious_ips", packets, scanner.find_suspicious_ips, syn_c, synack_c)
+    run_stage(results, "display", packets, display_quietly, suspicious)
+    return packets, results
+
+
+def compare(previous, results):
+    for name, stage in results.items():
+        before = previous["stages"].get(name)
+        if before and before["seconds"] > 0 and stage["seconds"] > before["seconds"] * (1 + REGRESSION):
+            print(f"REGRESSION {name}: {before['seconds']:.3f}s -> {stage['seconds']:.3f}s "
+                  f"(previous run {previous['time']}, revision {previous['revision']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the SYN scanner on a synthetic capture.")
+    parser.add_argument("--packets", type=int, default=200000, help="size of the generated capture")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pcap", help="use this capture instead of generating one")
+    parser.add_argument("--skip-scapy", action="store_true", help="only time the raw engine and later stages")
+    parser.add_argument("--history", default=HISTORY_PATH, help="JSON file the results are appended to")
+    args = parser.parse_args()
+
+    pcap_file = args.pcap or f"bench_{args.packets}_{args.seed}.pcap"
+    if not args.pcap and not os.path.exists(pcap_file):
+        print(f"Generating {args.packets} packets into {pcap_file}...")
+        traffic_gen.write_capture(pcap_file, args.packets, seed=args.seed)
+
+    packets, results = run_suite(pcap_file, args.skip_scapy)
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    same_input = [h for h in history if h["pcap"] == os.path.basename(pcap_file) and h["packets"] == packets]
+    if same_input:
+        compare(same_input[-1], results)
+    history.append({
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "pcap": os.path.basename(pcap_file),
+        "packets": packets,
+        "stages": results,
+    })
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=2)
+    print(f"Results appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import sketch
+from main import find_suspicious_ips
+from raw_pcap import int_to_ip
+
+BLOCK = 1000000
+
+
+def exact_dict_bytes(sources):
+    """
+    Measures what the exact syn_count dict costs per source and scales it up.
+    """
+    tracemalloc.start()
+    counts = {}
+    for ip in sources[:BLOCK].tolist():
+        key = int_to_ip(ip)
+        counts[key] = counts.get(key, 0) + 1
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used / min(BLOCK, len(sources)) * len(sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sketch backend with exact dicts on a synthetic spoofed SYN flood.")
+    parser.add_argument("--sources", type=int, default=50000000, help="spoofed source addresses, one SYN each")
+    parser.add_argument("--attackers", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=10000, help="well-behaved hosts that get their SYN-ACKs")
+    parser.add_argument("--heavy-hitters", type=int, default=sketch.HEAVY_HITTERS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    attackers = np.arange(args.attackers, dtype=np.uint32) + 0x0A000000
+    attacker_syn = rng.integers(1000, 5000, size=args.attackers)
+    clients = np.arange(args.clients, dtype=np.uint32) + 0x0B000000
+    client_syn = rng.integers(50, 500, size=args.clients)
+
+    counts = sketch.SketchCounts(k=args.heavy_hitters)
+    start = time.perf_counter()
+    counts.add_syn(np.repeat(attackers, attacker_syn))
+    counts.add_syn(np.repeat(clients, client_syn))
+    counts.add_syn_ack(np.repeat(clients, client_syn))
+    first_block = None
+    for done in range(0, args.sources, BLOCK):
+        block = rng.integers(0, 2**32, size=min(BLOCK, args.sources - done), dtype=np.uint32)
+        first_block = block if first_block is None else first_block
+        counts.add_syn(block)
+    elapsed = time.perf_counter() - start
+
+    truth = set(int_to_ip(int(ip)) for ip in attackers)
+    found = set(ip for ip, _, _, _ in find_suspicious_ips(counts.heavy, counts.syn_ack))
+    errors = [
+        counts.heavy[int_to_ip(int(ip))] - n
+        for ip, n in zip(attackers, attacker_syn)
+        if int_to_ip(int(ip)) in found
+    ]
+
+    print(f"sources: {args.sources}, sketch time: {elapsed:.1f}s ({args.sources / elapsed:.0f} SYN/sec)")
+    print(f"exact dicts: ~{exact_dict_bytes(first_block) / 2**20:.0f} MiB (extrapolated)")
+    print(f"sketch:      {counts.nbytes / 2**20:.1f} MiB")
+    print(f"attackers found: {len(found & truth)}/{len(truth)}, other IPs flagged: {len(found - truth)}")
+    if errors:
+        print(f"SYN overestimate on attackers: mean {np.mean(errors):.1f}, max {max(errors)}, "
+              f"bound {counts.syn.error_bound():.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import argparse
+import os
+import time
+
+import traffic_gen
+from raw_pcap import count_S_SA_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how count_S_SA_parallel scales with the number of workers.")
+    parser.add_argument("--pcap", help="capture to use; a synthetic one is generated when omitted")
+    parser.add_argument("--packets", type=int, default=5000000, help="size of the synthetic capture")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    pcap_file = args.pcap or "bench_workers.pcap"
+    if not args.pcap and not os.path.exists(pcap_file):
+        print(f"Generating {args.packets} packets into {pcap_file}...")
+        traffic_gen.write_capture(pcap_file, args.packets)
+
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>10} {'packets/sec':>14} {'speedup':>8}")
+    for workers in range(1, args.max_workers + 1):
+        start = time.perf_counter()
+        _, _, total, _ = count_S_SA_parallel([pcap_file], workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {total / elapsed:>14.0f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import collections
+import socket
+import struct
+import time
+
+import numpy as np
+
+from raw_pcap import RawCapture, classify_block, TCP_SYN, TCP_SYN_ACK
+
+WINDOWS = (1, 10, 60)
+BUCKET_SECONDS = 1
+MIN_SYN_RATE = 20  # SYNs per second an IP must send before it can be reported
+
+
+class SlidingWindowCounter:
+    """
+    Per-IP SYN and SYN-ACK counts over several sliding time windows.
+
+    Packets are added to the bucket of the current second. Every window keeps
+    running per-IP totals and a queue of the buckets it covers; when a bucket
+    falls out of a window its counts are subtracted again, and an IP whose
+    totals drop to zero is deleted. Memory therefore only holds the IPs seen
+    in the largest window, and each eviction is a single dict deletion.
+    """
+
+    def __init__(self, rate, windows=WINDOWS, min_syn_rate=MIN_SYN_RATE):
+        self.rate = rate
+        self.windows = sorted(windows)
+        self.min_syn_rate = min_syn_rate
+        self.queues = {w: collections.deque() for w in self.windows}
+        self.totals = {w: {} for w in self.windows}
+        self.alerted = {w: set() for w in self.windows}
+        self.current_index = None
+        self.current = None
+
+    def add(self, ts, ip, syn, syn_ack):
+        """
+        Counts syn SYNs sent by ip and syn_ack SYN-ACKs sent to it at time ts.
+
+        Returns:
+            list: (window, ip, SYN sent, SYN-ACK received) for every window
+            in which ip has just become suspicious.
+        """
+        index = int(ts // BUCKET_SECONDS)
+        if self.current_index is None or index > self.current_index:
+            self._advance(index)
+
+        counts = self.current.get(ip)
+        if counts is None:
+            counts = self.current[ip] = [0, 0]
+        counts[0] += syn
+        counts[1] += syn_ack
+
+        alerts = []
+        for w in self.windows:
+            total = self.totals[w].get(ip)
+            if total is None:
+                total = self.totals[w][ip] = [0, 0]
+            total[0] += syn
+            total[1] += syn_ack
+            if ip not in self.alerted[w] and self._suspicious(w, total):
+                self.alerted[w].add(ip)
+                alerts.append((w, ip, total[0], total[1]))
+        return alerts
+
+    def _suspicious(self, window, total):
+        syn_sent, synack_received = total
+        return syn_sent >= self.min_syn_rate * window and syn_sent > synack_received * self.rate
+
+    def _advance(self, index):
+        self.current_index = index
+        self.current = {}
+        for w in self.windows:
+            queue = self.queues[w]
+            queue.append((index, self.current))
+            cutoff = index - w // BUCKET_SECONDS
+            while queue and queue[0][0] <= cutoff:
+                self._expire(w, queue.popleft()[1])
+
+    def _expire(self, window, bucket):
+        totals = self.totals[window]
+        alerted = self.alerted[window]
+        for ip, (syn, syn_ack) in bucket.items():
+            total = totals[ip]
+            total[0] -= syn
+            total[1] -= syn_ack
+            if not total[0] and not total[1]:
+                del totals[ip]
+                alerted.discard(ip)
+
+    def tracked_ips(self):
+        return len(self.totals[self.windows[-1]])
+
+
+def report_alert(ts, alert):
+    window, ip, syn_sent, synack_received = alert
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+    print(f"[{stamp}] ALERT {ip}: {syn_sent} SYN sent, {synack_received} SYN-ACK received in the last {window}s")
+
+
+def replay_capture(counter, pcap_file, realtime=False):
+    """
+    Feeds a capture through the counter, optionally paced at the speed it was recorded.
+
+    Returns:
+        int: number of packets read.
+    """
+    ntoa = socket.inet_ntoa
+    pack = struct.Struct("!I").pack
+    total = 0
+    first_ts = None
+    wall_start = time.time()
+    with RawCapture(pcap_file) as capture:
+        buf = np.frombuffer(capture.mm, dtype=np.uint8)
+        for offsets, lengths, stamps in capture.iter_record_blocks():
+            valid, src, dst, flags = classify_block(buf, offsets, lengths)
+            total += len(offsets)
+            syn = valid & (flags == TCP_SYN)
+            syn_ack = valid & (flags == TCP_SYN_ACK)
+            idx = np.flatnonzero(syn | syn_ack)
+            rows = zip(stamps[idx].tolist(), syn[idx].tolist(), src[idx].tolist(), dst[idx].tolist())
+            for ts, is_syn, s, d in rows:
+                if realtime:
+                    first_ts = ts if first_ts is None else first_ts
+                    delay = (ts - first_ts) - (time.time() - wall_start)
+                    if delay > 0:
+                        time.sleep(delay)
+                if is_syn:
+                    alerts = counter.add(ts, ntoa(pack(s)), 1, 0)
+                else:
+                    alerts = counter.add(ts, ntoa(pack(d)), 0, 1)
+                for alert in alerts:
+                    report_alert(ts, alert)
+        del buf
+    return total
+
+
+def sniff_interface(counter, iface):
+    """
+    Feeds packets captured live on iface through the counter until interrupted.
+    """
+    from scapy.all import sniff, IP, TCP
+
+    def handle(packet):
+        if IP not in packet or TCP not in packet:
+            return
+        flags = int(packet[TCP].flags)
+        if flags == TCP_SYN:
+            alerts = counter.add(float(packet.time), packet[IP].src, 1, 0)
+        elif flags == TCP_SYN_ACK:
+            alerts = counter.add(float(packet.time), packet[IP].dst, 0, 1)
+        else:
+            return
+        for alert in alerts:
+            report_alert(float(packet.time), alert)
+
+    sniff(iface=iface, filter="tcp", prn=handle, store=False)
@@ -1,14 +1,63 @@
 # https://g.co/gemini/share/cc5b6f4297ad
-from scapy.all import *
-import pandas as pd
+# Scapy and pandas take seconds to import, so they are only imported by the
+# code paths that use them; NumPy, which the other modules use, is imported
+# lazily with them. Scapy is bound once through the lazy importer rather
+# than imported in the per-packet functions.
+import argparse
+import csv
+import heapq
+import json
+import os
+import sys
+import time
+
+# the one copy of instrument.py is deployed with resource_manager
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "CA1", "P3", "resource_manager"))
+import instrument
+
+raw_pcap = instrument.lazy_import('raw_pcap')
+live = instrument.lazy_import('live')
+sketch = instrument.lazy_import('sketch')
+summary_cache = instrument.lazy_import('summary_cache')
+scapy = instrument.lazy_import('scapy.all')
 
 RATE = 3
+REPORT_EVERY = 100000
+COLUMNS = ['IP', 'SYN_sent', 'SYN_ACK_received', 'Difference']
+OUTPUT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'json', '.parquet': 'parquet'}
+PARQUET_BATCH = 100000
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a whole number")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not at least 1")
+    return value
+
+def window_lengths(text):
+    """
+    Parses the --windows list: positive whole multiples of live.BUCKET_SECONDS.
+    """
+    windows = []
+    for part in text.split(","):
+        try:
+            seconds = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"window length {part.strip()!r} is not a whole number of seconds")
+        if seconds <= 0 or seconds % live.BUCKET_SECONDS:
+            raise argparse.ArgumentTypeError(
+                f"window length {seconds} is not a positive multiple of {live.BUCKET_SECONDS}s")
+        windows.append(seconds)
+    return windows
 
 def validate_layer(packet):
-    required_layers = [Ether, IP, TCP]
+    required_layers = [scapy.Ether, scapy.IP, scapy.TCP]
     return all(layer in packet for layer in required_layers)
 
 def update_tcp_flag_dict(packet, syn_count, syn_ack_count):
+    IP, TCP = scapy.IP, scapy.TCP
     if packet[TCP].flags == "S":
         syn_count[packet[IP].src] = syn_count.get(packet[IP].src, 0) + 1
     elif packet[TCP].flags == "SA":
@@ -21,6 +70,28 @@ def count_S_SA(packets):
         update_tcp_flag_dict(p, syn_count, syn_ack_count)
     return syn_count, syn_ack_count
 
+def report_progress(total, start):
+    elapsed = time.time() - start
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"  {total} packets read ({rate:.0f} packets/sec)")
+
+def stream_count_S_SA(pcap_file):
+    syn_count = {}
+    syn_ack_count = {}
+    total = 0
+    valid = 0
+    start = time.time()
+    with scapy.PcapReader(pcap_file) as reader:
+        for p in reader:
+            total += 1
+            if validate_layer(p):
+                valid += 1
+                update_tcp_flag_dict(p, syn_count, syn_ack_count)
+            if total % REPORT_EVERY == 0:
+                report_progress(total, start)
+    report_progress(total, start)
+    return syn_count, syn_ack_count, total, valid
+
 def find_suspicious_ips(syn_counts, synack_counts):
     suspicious_ips = []
     for ip in syn_counts.keys():
@@ -31,36 +102,202 @@ def find_suspicious_ips(syn_counts, synack_counts):
             suspicious_ips.append((ip, syn_sent, synack_received, syn_sent - synack_received))
     return suspicious_ips
 
-def display_suspicious_ips(suspicious_list):
-    df = pd.DataFrame(suspicious_list, columns=['IP', 'SYN_sent', 'SYN_ACK_received', 'Difference'])
-    df.sort_values(by='Difference', ascending=False, inplace=True)
-    print("\nSuspicious IPs:")
+def top_suspicious_ips(suspicious_list, k):
+    return heapq.nlargest(k, suspicious_list, key=lambda row: row[3])
+
+def display_suspicious_ips(suspicious_list, top=None):
+    import pandas as pd
+    rows = top_suspicious_ips(suspicious_list, top) if top else suspicious_list
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    if not top:
+        df.sort_values(by='Difference', ascending=False, inplace=True)
+    print("\nSuspicious IPs:" if not top else f"\nTop {top} suspicious IPs:")
     print(df.to_string(index=False))
     print(f"\nTotal suspicious IPs found: {len(suspicious_list)}")
 
+def write_suspicious_ips(suspicious_list, path, fmt):
+    """
+    Writes the suspicious IPs row by row in a machine-readable format.
+
+    Args:
+        suspicious_list (list): rows as returned by find_suspicious_ips.
+        path (str): output file.
+        fmt (str): 'csv', 'json' (one array), 'jsonl' or 'parquet'.
+    """
+    if fmt == 'parquet':
+        write_parquet(suspicious_list, path)
+        return
+    with open(path, 'w', newline='') as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(COLUMNS)
+            writer.writerows(suspicious_list)
+        elif fmt == 'json':
+            out.write('[')
+            for i, row in enumerate(suspicious_list):
+                out.write((',\n' if i else '\n') + json.dumps(dict(zip(COLUMNS, row))))
+            out.write('\n]\n')
+        else:
+            for row in suspicious_list:
+                out.write(json.dumps(dict(zip(COLUMNS, row))) + '\n')
+
+def write_parquet(suspicious_list, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([('IP', pa.string()), ('SYN_sent', pa.int64()),
+                        ('SYN_ACK_received', pa.int64()), ('Difference', pa.int64())])
+    with pq.ParquetWriter(path, schema) as writer:
+        for i in range(0, len(suspicious_list), PARQUET_BATCH):
+            batch = list(zip(*suspicious_list[i:i + PARQUET_BATCH]))
+            writer.write_table(pa.table([list(col) for col in batch], schema=schema))
+
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python syn_scanner.py <pcap_file>")
+    parser = argparse.ArgumentParser(description="Find IPs that send far more SYNs than they get SYN-ACKs back.")
+    parser.add_argument("pcap_file", nargs="?", help="capture file, or a directory of rotated captures")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the capture one packet at a time instead of loading it all into memory")
+    parser.add_argument("--engine", choices=["scapy", "raw"],
+                        help="'raw' decodes the frame bytes directly instead of dissecting with Scapy "
+                             "(default: scapy, raw with --workers or a directory)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="count with the raw engine in N processes, splitting the captures into chunks")
+    parser.add_argument("--live", action="store_true",
+                        help="run the sliding-window detector on --iface, or on pcap_file replayed as a live feed")
+    parser.add_argument("--iface", help="interface to capture from in --live mode")
+    parser.add_argument("--realtime", action="store_true",
+                        help="in --live replay, pace packets at the speed they were captured")
+    parser.add_argument("--windows", type=window_lengths,
+                        help="comma separated sliding window lengths in seconds for --live (default: 1,10,60)")
+    parser.add_argument("--sketch", action="store_true",
+                        help="count into fixed-size Count-Min sketches and keep only the top SYN senders")
+    parser.add_argument("--heavy-hitters", type=int,
+                        help="number of SYN senders tracked in --sketch mode (default: 1000)")
+    parser.add_argument("--top", type=positive_int, help="only show the K IPs with the largest SYN/SYN-ACK difference")
+    parser.add_argument("--output", help="write the suspicious IPs to this file instead of printing a table")
+    parser.add_argument("--format", choices=sorted(set(OUTPUT_FORMATS.values())),
+                        help="format for --output; guessed from the file extension by default")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse per-file SYN/SYN-ACK summaries and only count new or appended data")
+    parser.add_argument("--cache-dir", help="keep --cache summaries here instead of next to the captures")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start(args.stats, args.profile)
+
+    if not args.pcap_file and not (args.live and args.iface):
+        parser.error("pcap_file is required unless --live --iface is given")
+
+    pcap_file = args.pcap_file
+    if args.sketch and not args.live and os.path.isdir(pcap_file):
+        parser.error("--sketch reads one capture file; pass a file, not a directory")
+    caching = args.cache or args.cache_dir
+    if args.sketch and caching:
+        parser.error("--sketch does not use the summary cache; drop --cache")
+    for option, used in (("--sketch", args.sketch), ("--cache", caching)):
+        if used and args.workers > 1:
+            parser.error(f"{option} counts in one process; drop --workers")
+        if used and args.engine == "scapy":
+            parser.error(f"{option} counts with the raw engine, not --engine scapy")
+    parallel = not args.live and (args.workers > 1 or os.path.isdir(pcap_file))
+    if parallel and args.engine == "scapy":
+        parser.error("--workers and capture directories are counted with the raw engine, not --engine scapy")
+
+    if args.live:
+        windows = args.windows or list(live.WINDOWS)
+        counter = live.SlidingWindowCounter(RATE, windows)
+        if args.iface:
+            print(f"Watching {args.iface} over {windows}s windows (Ctrl-C to stop)...")
+            live.sniff_interface(counter, args.iface)
+        else:
+            print(f"Replaying {pcap_file} over {windows}s windows...")
+            start = time.time()
+            with instrument.timed("replay"):
+                total = live.replay_capture(counter, pcap_file, args.realtime)
+            instrument.count("packets parsed", total)
+            report_progress(total, start)
+            print(f"IPs still tracked: {counter.tracked_ips()}")
         return
 
-    pcap_file = sys.argv[1]
-
-    print(f"Reading {pcap_file}...")
-    all_packets = rdpcap(pcap_file)
-    print(f"Total packets read: {len(all_packets)}")
-    
-    print("Validating packets...")
-    valid_packets = [p for p in all_packets if validate_layer(p)]
-    print(f"Valid packets (Ether+IP+TCP): {len(valid_packets)}")
-    
-    print("Counting SYN and SYN-ACK packets...")
-    syn_c, synack_c = count_S_SA(valid_packets)
-    
+    if args.sketch:
+        print(f"Counting SYN and SYN-ACK packets in {pcap_file} into sketches...")
+        start = time.time()
+        with instrument.timed("count (sketch)"):
+            counts, total, valid = sketch.count_S_SA_sketch(pcap_file, k=args.heavy_hitters or sketch.HEAVY_HITTERS)
+        syn_c, synack_c = counts.heavy, counts.syn_ack
+        report_progress(total, start)
+        print(f"Total packets read: {total}")
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+        print(f"Sketch memory: {counts.nbytes // 1024} KiB, "
+              f"SYN-ACK counts overestimated by at most {synack_c.error_bound():.1f} "
+              f"with probability {1 - sketch.DELTA}")
+    elif caching:
+        pcap_files = raw_pcap.list_captures(pcap_file)
+        print(f"Loading summaries for {len(pcap_files)} file(s)...")
+        start = time.time()
+        with instrument.timed("count (cache)"):
+            syn_c, synack_c, total, valid, stats = summary_cache.count_S_SA_cached(pcap_files, args.cache_dir)
+        print(f"  {time.time() - start:.3f}s, files: " + ", ".join(f"{n} {how}" for how, n in sorted(stats.items())))
+        print(f"Total packets read: {total}")
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+    elif parallel:
+        pcap_files = raw_pcap.list_captures(pcap_file)
+        print(f"Counting SYN and SYN-ACK packets in {len(pcap_files)} file(s) with {args.workers} worker(s)...")
+        start = time.time()
+        with instrument.timed("count (parallel)"):
+            syn_c, synack_c, total, valid = raw_pcap.count_S_SA_parallel(pcap_files, args.workers)
+        report_progress(total, start)
+        print(f"Total packets read: {total}")
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+    elif args.engine == "raw":
+        print(f"Counting SYN and SYN-ACK packets in {pcap_file} (raw engine)...")
+        start = time.time()
+        with instrument.timed("count (raw)"):
+            syn_c, synack_c, total, valid = raw_pcap.count_S_SA_raw(pcap_file)
+        report_progress(total, start)
+        print(f"Total packets read: {total}")
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+    elif args.stream:
+        print(f"Streaming {pcap_file}...")
+        with instrument.timed("count (stream)"):
+            syn_c, synack_c, total, valid = stream_count_S_SA(pcap_file)
+        print(f"Total packets read: {total}")
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+    else:
+        print(f"Reading {pcap_file}...")
+        with instrument.timed("read (scapy)"):
+            all_packets = scapy.rdpcap(pcap_file)
+        total = len(all_packets)
+        print(f"Total packets read: {total}")
+
+        print("Validating packets...")
+        with instrument.timed("validate (scapy)"):
+            valid_packets = [p for p in all_packets if validate_layer(p)]
+        valid = len(valid_packets)
+        print(f"Valid packets (Ether+IP+TCP): {valid}")
+
+        print("Counting SYN and SYN-ACK packets...")
+        with instrument.timed("count (scapy)"):
+            syn_c, synack_c = count_S_SA(valid_packets)
+    instrument.count("packets parsed", total)
+    instrument.count("valid packets", valid)
+
     print("Finding suspicious IPs...")
-    suspicious_list = find_suspicious_ips(syn_c, synack_c)
-    
-    display_suspicious_ips(suspicious_list)
+    with instrument.timed("find suspicious IPs"):
+        if args.cache or args.cache_dir:
+            # the cached counts are arrays; only the suspicious IPs are formatted
+            suspicious_list = summary_cache.find_suspicious_ips(syn_c, synack_c, RATE)
+        else:
+            suspicious_list = find_suspicious_ips(syn_c, synack_c)
+    instrument.count("suspicious IPs", len(suspicious_list))
+
+    with instrument.timed("output"):
+        if args.output:
+            fmt = args.format or OUTPUT_FORMATS.get(os.path.splitext(args.output)[1], 'csv')
+            rows = top_suspicious_ips(suspicious_list, args.top) if args.top else suspicious_list
+            write_suspicious_ips(rows, args.output, fmt)
+            print(f"Wrote {len(rows)} of {len(suspicious_list)} suspicious IPs to {args.output} ({fmt})")
+        else:
+            display_suspicious_ips(suspicious_list, args.top)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,415 @@
+import mmap
+import multiprocessing
+import os
+import socket
+import struct
+
+import numpy as np
+
+GLOBAL_HEADER_LEN = 24
+RECORD_HEADER_LEN = 16
+LINKTYPE_ETHERNET = 1
+BLOCK_RECORDS = 1 << 20
+# largest snapshot length tcpdump and Wireshark write; a record claiming more
+# bytes means the framing is lost, so reading on would only yield garbage
+MAX_FRAME_LEN = 262144
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_BYTES = 1 << 20
+
+# magic -> (byte order, timestamp units per second)
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e9),
+}
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 1
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+PCAPNG_BYTE_ORDER = {b"\x4d\x3c\x2b\x1a": "<", b"\x1a\x2b\x3c\x4d": ">"}
+PCAPNG_OPT_TSRESOL = 9
+
+ETH_HEADER_LEN = 14
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+VLAN_TAG_LEN = 4
+IP_PROTO_TCP = 6
+TCP_SYN = 0x02
+TCP_SYN_ACK = 0x12
+
+
+class RawCapture:
+    """
+    A memory-mapped pcap or pcapng file whose records are walked without Scapy.
+
+    Only the record framing is decoded here; frames from non-Ethernet
+    interfaces are reported with a captured length of 0 so they never
+    pass validation.
+    """
+
+    def __init__(self, pcap_file):
+        self.path = pcap_file
+        self.position = None  # offset just past the last complete record read
+        with open(pcap_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self.mm[:4]
+        self.pcapng = magic == PCAPNG_SHB.to_bytes(4, "big")
+        if self.pcapng:
+            self.endian = None
+            self.interfaces = []
+            self.first_record = 0
+            self._read_pcapng_preamble()
+        elif magic in PCAP_MAGIC and len(self.mm) >= GLOBAL_HEADER_LEN:
+            self.endian, self.ts_units = PCAP_MAGIC[magic]
+            linktype = struct.unpack_from(self.endian + "I", self.mm, 20)[0]
+            if linktype != LINKTYPE_ETHERNET:
+                self.close()
+                raise ValueError(f"{pcap_file} has link type {linktype}, only Ethernet is supported")
+            self.first_record = GLOBAL_HEADER_LEN
+        else:
+            self.close()
+            raise ValueError(f"{pcap_file} is not a pcap or pcapng file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except BufferError:
+            # arrays over the map still live in the frames of the exception;
+            # the map is freed with them, and that exception is the one to report
+            if exc_type is None:
+                raise
+
+    def close(self):
+        self.mm.close()
+
+    def _read_pcapng_preamble(self):
+        # interface descriptions precede the packets that reference them, so
+        # parsing the leading blocks is enough for a reader that starts mid-file
+        pos = 0
+        while pos + 12 <= len(self.mm):
+            block_type, block_len = self._pcapng_block_header(pos)
+            if block_type not in (PCAPNG_SHB, PCAPNG_IDB):
+                break
+            pos += block_len
+        self.first_record = pos
+
+    def _pcapng_block_header(self, pos):
+        block_type = struct.unpack_from("<I", self.mm, pos)[0]
+        if block_type == PCAPNG_SHB:
+            self.endian = PCAPNG_BYTE_ORDER[self.mm[pos + 8:pos + 12]]
+            self.interfaces = []
+        block_len = struct.unpack_from(self.endian + "I", self.mm, pos + 4)[0]
+        block_type = struct.unpack_from(self.endian + "I", self.mm, pos)[0]
+        if block_type == PCAPNG_IDB:
+            self.interfaces.append(self._parse_idb(pos, block_len))
+        return block_type, block_len
+
+    def _parse_idb(self, pos, block_len):
+        linktype = struct.unpack_from(self.endian + "H", self.mm, pos + 8)[0]
+        ts_units = 1e6
+        opt = pos + 16
+        while opt + 4 <= pos + block_len - 4:
+            code, length = struct.unpack_from(self.endian + "HH", self.mm, opt)
+            if code == 0:
+                break
+            if code == PCAPNG_OPT_TSRESOL:
+                resol = self.mm[opt + 4]
+                ts_units = float(2 ** (resol & 0x7F) if resol & 0x80 else 10 ** resol)
+            opt += 4 + (length + 3) // 4 * 4
+        return linktype, ts_units
+
+    def chunk_starts(self, chunk_bytes):
+        """
+        Walks the record headers and returns where chunks of about chunk_bytes begin.
+
+        Only the framing is read, not the packets, and every boundary is a
+        real record header, so packet bytes that look like headers cannot
+        misplace a split. For pcapng the interfaces described so far are
+        returned with each boundary, since a chunk may use interfaces whose
+        description blocks lie in an earlier chunk.
+
+        Returns:
+            list: (offset, interfaces) for every chunk, the first at first_record;
+            interfaces is (byte order, interface list) for pcapng, None for pcap.
+        """
+        size = len(self.mm)
+        pos = self.first_record
+        starts = []
+        target = pos
+        if self.pcapng:
+            self._read_pcapng_preamble()  # interfaces as they are at first_record
+            while pos + 12 <= size:
+                if pos >= target:
+                    starts.append((pos, (self.endian, list(self.interfaces))))
+                    target = pos + chunk_bytes
+                _, block_len = self._pcapng_block_header(pos)
+                if block_len < 12:
+                    break
+                pos += block_len
+        else:
+            unpack = struct.Struct(self.endian + "I").unpack_from
+            while pos + RECORD_HEADER_LEN <= size:
+                if pos >= target:
+                    starts.append((pos, None))
+                    target = pos + chunk_bytes
+                incl_len = unpack(self.mm, pos + 8)[0]
+                if incl_len > MAX_FRAME_LEN:
+                    raise self._corrupt(pos, incl_len)
+                pos += RECORD_HEADER_LEN + incl_len
+        return starts or [(self.first_record, None)]
+
+    def iter_records(self, start=None, end=None):
+        """
+        Yields (data offset, captured length, timestamp) for every packet record
+        whose header starts in [start, end).
+        """
+        pos = self.first_record if start is None else start
+        end = len(self.mm) if end is None else end
+        self.position = pos
+        if self.pcapng:
+            yield from self._iter_pcapng(pos, end)
+            return
+        unpack = struct.Struct(self.endian + "IIII").unpack_from
+        size = len(self.mm)
+        ts_units = self.ts_units
+        while pos + RECORD_HEADER_LEN <= end:
+            ts_sec, ts_frac, incl_len, _ = unpack(self.mm, pos)
+            if incl_len > MAX_FRAME_LEN:
+                raise self._corrupt(pos, incl_len)
+            pos += RECORD_HEADER_LEN
+            if pos + incl_len > size:
+                return  # truncated final record
+            yield pos, incl_len, ts_sec + ts_frac / ts_units
+            pos += incl_len
+            self.position = pos
+
+    def _iter_pcapng(self, pos, end):
+        size = len(self.mm)
+        while pos < end and pos + 12 <= size:
+            block_type, block_len = self._pcapng_block_header(pos)
+            if block_len < 12 or pos + block_len > size:
+                return
+            if block_type == PCAPNG_EPB:
+                iface, ts_hi, ts_lo, cap_len = struct.unpack_from(self.endian + "IIII", self.mm, pos + 8)
+                if cap_len > MAX_FRAME_LEN:
+                    raise self._corrupt(pos, cap_len)
+                linktype, ts_units = self.interfaces[iface]
+                if linktype != LINKTYPE_ETHERNET:
+                    cap_len = 0
+                yield pos + 28, cap_len, ((ts_hi << 32) | ts_lo) / ts_units
+            elif block_type == PCAPNG_SPB:
+                orig_len = struct.unpack_from(self.endian + "I", self.mm, pos + 8)[0]
+                linktype, _ = self.interfaces[0]
+                cap_len = min(orig_len, block_len - 16) if linktype == LINKTYPE_ETHERNET else 0
+                yield pos + 12, cap_len, 0.0
+            pos += block_len
+            self.position = pos
+
+    def _corrupt(self, pos, length):
+        return ValueError(f"{self.path}: the record at offset {pos} claims {length} bytes, "
+                          f"more than {MAX_FRAME_LEN}; the capture is corrupt")
+
+    def iter_record_blocks(self, start=None, end=None, block=BLOCK_RECORDS):
+        """
+        Groups iter_records into blocks of NumPy arrays for classify_block.
+
+        Yields:
+            tuple: (data offsets, captured lengths, timestamps)
+        """
+        offsets = []
+        lengths = []
+        stamps = []
+        for offset, length, stamp in self.iter_records(start, end):
+            offsets.append(offset)
+            lengths.append(length)
+            stamps.append(stamp)
+            if len(offsets) == block:
+                yield np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), np.array(stamps)
+                offsets, lengths, stamps = [], [], []
+        if offsets:
+            yield np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), np.array(stamps)
+
+
+def _read_u32(buf, idx):
+    b = buf[idx[:, None] + np.arange(4)].astype(np.uint32)
+    return (b[:, 0] << 24) | (b[:, 1] << 16) | (b[:, 2] << 8) | b[:, 3]
+
+
+def classify_block(buf, offsets, lengths):
+    """
+    Decodes the fields the scanner needs from a block of Ethernet frames at once.
+
+    Returns:
+        tuple: (valid mask, IP src, IP dst, TCP flags), one entry per frame.
+        Frames that are not Ether+IP+TCP are False in the mask and their
+        other fields are meaningless.
+    """
+    n = len(offsets)
+    valid = lengths >= ETH_HEADER_LEN + 20
+    off = np.where(valid, offsets, 0)
+
+    ethertype = (buf[off + 12].astype(np.uint16) << 8) | buf[off + 13]
+    # one 802.1Q tag shifts the IP header by four bytes
+    tagged = valid & (ethertype == ETHERTYPE_VLAN) & (lengths >= ETH_HEADER_LEN + VLAN_TAG_LEN + 20)
+    ethertype[tagged] = (buf[off[tagged] + 16].astype(np.uint16) << 8) | buf[off[tagged] + 17]
+    eth_len = np.where(tagged, ETH_HEADER_LEN + VLAN_TAG_LEN, ETH_HEADER_LEN)
+    ip = off + eth_len
+    ihl = (buf[ip] & 0x0F).astype(np.int64) * 4
+    frag = ((buf[ip + 6].astype(np.uint16) & 0x1F) << 8) | buf[ip + 7]
+    valid &= (ethertype == ETHERTYPE_IPV4) & (buf[ip + 9] == IP_PROTO_TCP)
+    valid &= (frag == 0) & (ihl >= 20)
+    valid &= lengths >= eth_len + ihl + 14
+
+    ip = np.where(valid, ip, ETH_HEADER_LEN)
+    flags = np.zeros(n, dtype=np.uint8)
+    flags[valid] = buf[ip[valid] + ihl[valid] + 13]
+    src = _read_u32(buf, ip + 12)
+    dst = _read_u32(buf, ip + 16)
+    return valid, src, dst, flags
+
+
+def ip_to_int(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+def _add_counts(addresses, counts):
+    # keep first-seen order so the dict matches what count_S_SA builds
+    if not len(addresses):
+        return
+    uniq, first, n = np.unique(addresses, return_index=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    pack = struct.Struct("!I").pack
+    for ip, c in zip(uniq[order].tolist(), n[order].tolist()):
+        key = socket.inet_ntoa(pack(ip))
+        counts[key] = counts.get(key, 0) + c
+
+
+def count_capture(capture, start=None, end=None):
+    """
+    Counts SYN and SYN-ACK packets of an open RawCapture; see count_S_SA_raw.
+    """
+    syn_count = {}
+    syn_ack_count = {}
+    total = 0
+    valid_total = 0
+    buf = np.frombuffer(capture.mm, dtype=np.uint8)
+    for offsets, lengths, _ in capture.iter_record_blocks(start, end):
+        valid, src, dst, flags = classify_block(buf, offsets, lengths)
+        total += len(offsets)
+        valid_total += int(valid.sum())
+        _add_counts(src[valid & (flags == TCP_SYN)], syn_count)
+        _add_counts(dst[valid & (flags == TCP_SYN_ACK)], syn_ack_count)
+    del buf
+    return syn_count, syn_ack_count, total, valid_total
+
+
+def count_S_SA_raw(pcap_file, start=None, end=None, interfaces=None):
+    """
+    Counts SYN and SYN-ACK packets straight from the frame bytes, without Scapy.
+
+    Produces the same dictionaries as count_S_SA over the Ether+IP+TCP packets
+    of the capture. start/end restrict the work to a byte range of record
+    headers; interfaces is the pcapng interface table at start, as returned
+    by RawCapture.chunk_starts.
+
+    Returns:
+        tuple: (syn_count, syn_ack_count, total packets, valid packets)
+    """
+    with RawCapture(pcap_file) as capture:
+        if interfaces is not None:
+            capture.endian, capture.interfaces = interfaces[0], list(interfaces[1])
+        return count_capture(capture, start, end)
+
+
+def list_captures(path):
+    """
+    Returns the capture files to analyse: path itself, or every non-hidden
+    pcap or pcapng file in it (sorted, so rotated captures keep their order)
+    when it is a directory. Other files, like a --cache-dir inside it, are
+    skipped with a warning.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    captures = []
+    for name in sorted(n for n in os.listdir(path) if not n.startswith(".")):
+        full = os.path.join(path, name)
+        if not os.path.isfile(full):
+            continue
+        if not is_capture(full):
+            print(f"Skipping {full}: not a pcap or pcapng file")
+            continue
+        captures.append(full)
+    return captures
+
+
+def is_capture(path):
+    """
+    Tells whether a file starts with a pcap or pcapng magic number.
+    """
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:4] in PCAP_MAGIC:
+        return True
+    return head[:4] == PCAPNG_SHB.to_bytes(4, "big") and head[8:12] in PCAPNG_BYTE_ORDER
+
+
+def plan_chunks(pcap_files, workers):
+    """
+    Splits the captures into (file, start, end, interfaces) byte ranges at record headers.
+    """
+    sizes = [os.path.getsize(f) for f in pcap_files]
+    chunk_bytes = max(MIN_CHUNK_BYTES, sum(sizes) // max(1, workers * CHUNKS_PER_WORKER))
+    chunks = []
+    for pcap_file, size in zip(pcap_files, sizes):
+        with RawCapture(pcap_file) as capture:
+            starts = capture.chunk_starts(chunk_bytes)
+        ends = [start for start, _ in starts[1:]] + [size]
+        chunks.extend((pcap_file, start, end, interfaces) for (start, interfaces), end in zip(starts, ends) if end > start)
+    return chunks
+
+
+def _count_chunk(chunk):
+    return count_S_SA_raw(*chunk)
+
+
+def merge_counts(into, counts):
+    for ip, c in counts.items():
+        into[ip] = into.get(ip, 0) + c
+
+
+def count_S_SA_parallel(pcap_files, workers):
+    """
+    Counts a list of captures with count_S_SA_raw in a pool of worker processes.
+
+    Chunk results are merged in file order, so the dicts match a serial run.
+
+    Returns:
+        tuple: (syn_count, syn_ack_count, total packets, valid packets)
+    """
+    chunks = plan_chunks(pcap_files, workers)
+    syn_count = {}
+    syn_ack_count = {}
+    total = 0
+    valid = 0
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(_count_chunk, chunks) if pool else map(_count_chunk, chunks)
+        for syn_c, synack_c, n, v in results:
+            merge_counts(syn_count, syn_c)
+            merge_counts(syn_ack_count, synack_c)
+            total += n
+            valid += v
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return syn_count, syn_ack_count, total, valid
@@ -0,0 +1,179 @@
+import math
+import sys
+
+import numpy as np
+
+from raw_pcap import RawCapture, classify_block, int_to_ip, ip_to_int, TCP_SYN, TCP_SYN_ACK
+
+EPSILON = 1e-5
+DELTA = 1e-3
+HEAVY_HITTERS = 1000
+HASH_SEED = 0x5EED
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch over IPv4 addresses held as uint32.
+
+    With width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)) an estimate
+    never undercounts and overcounts by more than epsilon * N (N = total count
+    added) with probability at least 1 - delta. Memory is depth * width
+    counters no matter how many distinct addresses are added.
+
+    get() takes a dotted-quad string so the sketch can stand in for the
+    syn_ack_count dict in find_suspicious_ips.
+    """
+
+    def __init__(self, epsilon=EPSILON, delta=DELTA, seed=HASH_SEED):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing; odd multipliers keep it a bijection mod 2**64
+        self.mul = rng.integers(1, 2**63, size=self.depth, dtype=np.uint64) | np.uint64(1)
+        self.offset = rng.integers(0, 2**63, size=self.depth, dtype=np.uint64)
+        self.total = 0
+
+    def _columns(self, keys):
+        keys = keys.astype(np.uint64)
+        hashed = keys[None, :] * self.mul[:, None] + self.offset[:, None]
+        return ((hashed >> np.uint64(32)) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts):
+        columns = self._columns(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+        self.total += int(np.sum(counts))
+
+    def estimate(self, keys):
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def get(self, ip, default=0):
+        value = int(self.estimate(np.array([ip_to_int(ip)], dtype=np.uint32))[0])
+        return value if value else default
+
+    def error_bound(self):
+        return math.e / self.width * self.total
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + self.mul.nbytes + self.offset.nbytes
+
+
+class HeavyHitters:
+    """
+    The k addresses with the largest SYN minus SYN-ACK estimates seen so far.
+
+    Ranking by the difference rather than by SYNs alone keeps busy clients
+    whose handshakes complete from crowding out the senders that
+    find_suspicious_ips looks for. Only addresses whose score exceeds the
+    current k-th largest are admitted, so it is bounded to k entries, and
+    scores within the sketch's error bound are dropped as indistinguishable
+    from hash collisions. Exposes keys() and [] like the syn_count dict that
+    find_suspicious_ips walks; values are Count-Min SYN estimates.
+    """
+
+    def __init__(self, k=HEAVY_HITTERS):
+        self.k = k
+        self.counts = {}
+        self.scores = {}
+        self.threshold = 0
+
+    def key_array(self):
+        return np.fromiter(self.counts, dtype=np.uint32, count=len(self.counts))
+
+    def offer(self, keys, estimates, scores, minimum=0):
+        """
+        Updates the kept addresses among keys and admits the others that rank high enough.
+
+        Args:
+            keys (np.ndarray): Addresses as uint32.
+            estimates (np.ndarray): Their SYN estimates.
+            scores (np.ndarray): Their SYN minus SYN-ACK estimates.
+            minimum (float): Scores up to this are not kept.
+        """
+        threshold = self.threshold if len(self.counts) >= self.k else 0
+        candidates = (scores > max(threshold, minimum)) | np.isin(keys, self.key_array())
+        for key, value, score in zip(keys[candidates].tolist(), estimates[candidates].tolist(),
+                                     scores[candidates].tolist()):
+            if score <= minimum:
+                self.counts.pop(key, None)
+                self.scores.pop(key, None)
+                continue
+            self.counts[key] = value
+            self.scores[key] = score
+        if len(self.counts) > self.k:
+            ranked = sorted(self.scores.items(), key=lambda item: item[1], reverse=True)[:self.k]
+            self.scores = dict(ranked)
+            self.counts = {key: self.counts[key] for key in self.scores}
+        if len(self.counts) >= self.k:
+            self.threshold = min(self.scores.values())
+
+    def keys(self):
+        return [int_to_ip(key) for key in self.counts]
+
+    def __getitem__(self, ip):
+        return self.counts[ip_to_int(ip)]
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def nbytes(self):
+        # measured: the two dicts' tables plus the int and number objects they hold
+        size = sys.getsizeof(self.counts) + sys.getsizeof(self.scores)
+        for key, value in self.counts.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value) + sys.getsizeof(self.scores[key])
+        return size
+
+
+class SketchCounts:
+    """
+    Fixed-memory replacement for the syn_count/syn_ack_count pair.
+    """
+
+    def __init__(self, epsilon=EPSILON, delta=DELTA, k=HEAVY_HITTERS):
+        self.syn = CountMinSketch(epsilon, delta)
+        self.syn_ack = CountMinSketch(epsilon, delta, seed=HASH_SEED + 1)
+        self.heavy = HeavyHitters(k)
+
+    def add_syn(self, sources):
+        keys, counts = np.unique(sources, return_counts=True)
+        self.syn.add(keys, counts)
+        # the kept addresses are scored again, as SYN-ACKs may have come in since
+        keys = np.union1d(keys, self.heavy.key_array())
+        estimates = self.syn.estimate(keys)
+        self.heavy.offer(keys, estimates, estimates - self.syn_ack.estimate(keys), self.syn.error_bound())
+
+    def add_syn_ack(self, destinations):
+        keys, counts = np.unique(destinations, return_counts=True)
+        self.syn_ack.add(keys, counts)
+
+    @property
+    def nbytes(self):
+        return self.syn.nbytes + self.syn_ack.nbytes + self.heavy.nbytes
+
+
+def count_S_SA_sketch(pcap_file, epsilon=EPSILON, delta=DELTA, k=HEAVY_HITTERS):
+    """
+    Counts SYN and SYN-ACK packets into sketches instead of exact dicts.
+
+    Returns:
+        tuple: (SketchCounts, total packets, valid packets); its heavy and
+        syn_ack members can be passed straight to find_suspicious_ips.
+    """
+    counts = SketchCounts(epsilon, delta, k)
+    total = 0
+    valid_total = 0
+    with RawCapture(pcap_file) as capture:
+        buf = np.frombuffer(capture.mm, dtype=np.uint8)
+        for offsets, lengths, _ in capture.iter_record_blocks():
+            valid, src, dst, flags = classify_block(buf, offsets, lengths)
+            total += len(offsets)
+            valid_total += int(valid.sum())
+            # SYN-ACKs first, so the heavy hitters are scored with this block's replies
+            counts.add_syn_ack(dst[valid & (flags == TCP_SYN_ACK)])
+            counts.add_syn(src[valid & (flags == TCP_SYN)])
+        del buf
+    return counts, total, valid_total
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from raw_pcap import RawCapture, count_capture, int_to_ip, ip_to_int
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".syn-summary.npz"
+FINGERPRINT_BYTES = 4096
+
+
+def cache_path(pcap_file, cache_dir=None):
+    """
+    Returns where the summary of pcap_file lives: a hidden sidecar next to it,
+    or a file in cache_dir named after its absolute path.
+    """
+    if cache_dir is None:
+        head, tail = os.path.split(pcap_file)
+        return os.path.join(head, "." + tail + CACHE_SUFFIX)
+    key = hashlib.sha1(os.path.abspath(pcap_file).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, os.path.basename(pcap_file) + "." + key + CACHE_SUFFIX)
+
+
+def _fingerprint(pcap_file):
+    with open(pcap_file, "rb") as f:
+        return hashlib.sha1(f.read(FINGERPRINT_BYTES)).hexdigest()
+
+
+def _to_arrays(counts):
+    ips = np.fromiter((ip_to_int(ip) for ip in counts), dtype=np.uint32, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    return ips, values
+
+
+def merge_arrays(*summaries):
+    """
+    Adds up (IPs, counts) array pairs.
+
+    Returns:
+        tuple: (IPs, counts) with every IP once, sorted by IP.
+    """
+    ips = np.concatenate([ips for ips, _ in summaries] + [np.zeros(0, dtype=np.uint32)])
+    values = np.concatenate([values for _, values in summaries] + [np.zeros(0, dtype=np.int64)])
+    merged, inverse = np.unique(ips, return_inverse=True)
+    totals = np.zeros(len(merged), dtype=np.int64)
+    np.add.at(totals, inverse, values)
+    return merged, totals
+
+
+def find_suspicious_ips(syn, syn_ack, rate):
+    """
+    find_suspicious_ips of main.py over merged (IPs, counts) arrays.
+
+    Only the IPs of the rows returned are formatted as strings.
+
+    Returns:
+        list: (IP, SYN sent, SYN-ACK received, difference) rows, by IP.
+    """
+    syn_ips, syn_counts = syn
+    synack_ips, synack_counts = syn_ack
+    pos = np.searchsorted(synack_ips, syn_ips)
+    found = pos < len(synack_ips)
+    found[found] = synack_ips[pos[found]] == syn_ips[found]
+    received = np.zeros(len(syn_ips), dtype=np.int64)
+    received[found] = synack_counts[pos[found]]
+    rows = np.nonzero(syn_counts > received * rate)[0]
+    return [(int_to_ip(ip), sent, got, sent - got)
+            for ip, sent, got in zip(syn_ips[rows].tolist(), syn_counts[rows].tolist(), received[rows].tolist())]
+
+
+def load_summary(path):
+    try:
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].item())
+            if meta.get("version") != CACHE_VERSION:
+                return None
+            syn = data["syn_ip"], data["syn_count"]
+            syn_ack = data["synack_ip"], data["synack_count"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta, syn, syn_ack
+
+
+def save_summary(path, meta, syn, syn_ack):
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), syn_ip=syn[0], syn_count=syn[1],
+                     synack_ip=syn_ack[0], synack_count=syn_ack[1])
+        os.replace(tmp, path)
+    except OSError as e:
+        # e.g. a read-only capture directory: the counts are still good, only not kept
+        print(f"Could not save summary {path}: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def summarize(pcap_file, cache_dir=None):
+    """
+    Returns the per-IP SYN/SYN-ACK counts of one capture, using its cached summary.
+
+    A summary is reused as is when the file size and mtime match. If the file
+    has only grown (same leading bytes), just the records after the last
+    indexed offset are counted and merged in. Anything else is a full recount.
+
+    Returns:
+        tuple: (syn, syn_ack, total packets, valid packets, how) where syn and
+        syn_ack are (IPs as uint32, counts) arrays and how is 'cached',
+        'appended' or 'counted'.
+    """
+    path = cache_path(pcap_file, cache_dir)
+    stat = os.stat(pcap_file)
+    fingerprint = _fingerprint(pcap_file)
+    cached = load_summary(path)
+
+    start = None
+    how = "counted"
+    syn, syn_ack, total, valid = (), (), 0, 0
+    if cached:
+        meta, cached_syn, cached_synack = cached
+        same_file = meta["fingerprint"] == fingerprint and stat.st_size >= meta["size"]
+        if same_file and stat.st_size == meta["size"] and stat.st_mtime_ns == meta["mtime_ns"]:
+            return cached_syn, cached_synack, meta["total"], meta["valid"], "cached"
+        if same_file:
+            start = meta["offset"]
+            syn, syn_ack = (cached_syn,), (cached_synack,)
+            total, valid = meta["total"], meta["valid"]
+            how = "appended"
+
+    with RawCapture(pcap_file) as capture:
+        new_syn, new_synack, new_total, new_valid = count_capture(capture, start)
+        offset = capture.position if capture.position is not None else capture.first_record
+    syn = merge_arrays(*syn, _to_arrays(new_syn))
+    syn_ack = merge_arrays(*syn_ack, _to_arrays(new_synack))
+    total += new_total
+    valid += new_valid
+
+    meta = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(pcap_file),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "fingerprint": fingerprint,
+        "offset": offset,
+        "total": total,
+        "valid": valid,
+    }
+    save_summary(path, meta, syn, syn_ack)
+    return syn, syn_ack, total, valid, how
+
+
+def count_S_SA_cached(pcap_files, cache_dir=None):
+    """
+    Merges the cached summaries of several captures, refreshing stale ones.
+
+    The counts stay NumPy arrays keyed by the IP as uint32; pass them to
+    find_suspicious_ips of this module.
+
+    Returns:
+        tuple: (syn, syn_ack, total packets, valid packets, {how: files}),
+        syn and syn_ack as (IPs, counts) arrays sorted by IP.
+    """
+    syn = []
+    syn_ack = []
+    total = 0
+    valid = 0
+    stats = {}
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    for pcap_file in pcap_files:
+        syn_c, synack_c, n, v, how = summarize(pcap_file, cache_dir)
+        syn.append(syn_c)
+        syn_ack.append(synack_c)
+        total += n
+        valid += v
+        stats[how] = stats.get(how, 0) + 1
+    return merge_arrays(*syn), merge_arrays(*syn_ack), total, valid, stats
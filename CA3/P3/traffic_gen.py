@@ -0,0 +1,103 @@
+import argparse
+import random
+import struct
+
+PCAP_HEADER = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+RECORD_HEADER = struct.Struct("<IIII")
+
+TCP_SYN = 0x02
+TCP_SYN_ACK = 0x12
+TCP_ACK = 0x10
+
+SERVER_NET = 0xC0A80000   # 192.168.0.0/16
+CLIENT_NET = 0x0A000000   # 10.0.0.0/8
+ATTACKER_NET = 0xAC100000  # 172.16.0.0/12
+
+# share of generated packets per traffic kind
+MIX = {"handshake": 0.6, "flood": 0.3, "noise": 0.1}
+
+
+def ethernet(payload, ethertype=0x0800):
+    return b"\x00\x00\x5e\x00\x01\x02\x00\x00\x5e\x00\x01\x01" + struct.pack("!H", ethertype) + payload
+
+
+def ipv4(src, dst, proto, payload):
+    return struct.pack("!BBHHHBBHII", 0x45, 0, 20 + len(payload), 1, 0, 64, proto, 0, src, dst) + payload
+
+
+def tcp_frame(src, dst, flags, sport=40000, dport=80):
+    segment = struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 0x50, flags, 8192, 0, 0)
+    return ethernet(ipv4(src, dst, 6, segment))
+
+
+def udp_frame(src, dst, sport=5353, dport=53):
+    return ethernet(ipv4(src, dst, 17, struct.pack("!HHHH", sport, dport, 8, 0)))
+
+
+def arp_frame(src, dst):
+    body = struct.pack("!HHBBH6sI6sI", 1, 0x0800, 6, 4, 1, b"\x00\x00\x5e\x00\x01\x01", src, b"\x00" * 6, dst)
+    return ethernet(body, 0x0806)
+
+
+def generate(packets, seed=1, servers=16, clients=5000, attackers=20, spoofed=False, mix=MIX):
+    """
+    Yields (timestamp, frame) pairs of deterministic synthetic traffic.
+
+    Handshakes are SYN, SYN-ACK, ACK between clients and servers. Flood
+    packets are SYNs from a small set of attackers (or random sources when
+    spoofed) that are never answered. Noise is UDP and ARP.
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    ts = 1700000000.0
+    sent = 0
+    while sent < packets:
+        kind = rng.choices(kinds, weights)[0]
+        server = SERVER_NET + rng.randrange(servers)
+        if kind == "handshake":
+            client = CLIENT_NET + rng.randrange(clients)
+            sport = rng.randrange(1024, 65535)
+            frames = [
+                tcp_frame(client, server, TCP_SYN, sport),
+                tcp_frame(server, client, TCP_SYN_ACK, 80, sport),
+                tcp_frame(client, server, TCP_ACK, sport),
+            ]
+        elif kind == "flood":
+            source = rng.getrandbits(32) if spoofed else ATTACKER_NET + rng.randrange(attackers)
+            frames = [tcp_frame(source, server, TCP_SYN, rng.randrange(1024, 65535))]
+        else:
+            host = CLIENT_NET + rng.randrange(clients)
+            frames = [udp_frame(host, server) if rng.random() < 0.5 else arp_frame(host, server)]
+        for frame in frames[:packets - sent]:
+            ts += rng.expovariate(10000)
+            yield ts, frame
+            sent += 1
+
+
+def write_capture(path, packets, **kwargs):
+    """
+    Writes generate(packets, **kwargs) to a classic little-endian pcap file.
+    """
+    with open(path, "wb") as f:
+        f.write(PCAP_HEADER)
+        for ts, frame in generate(packets, **kwargs):
+            sec = int(ts)
+            f.write(RECORD_HEADER.pack(sec, int((ts - sec) * 1e6), len(frame), len(frame)))
+            f.write(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic capture for the SYN scanner.")
+    parser.add_argument("output")
+    parser.add_argument("--packets", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--attackers", type=int, default=20)
+    parser.add_argument("--spoofed", action="store_true", help="flood from random source addresses")
+    args = parser.parse_args()
+    write_capture(args.output, args.packets, seed=args.seed, attackers=args.attackers, spoofed=args.spoofed)
+    print(f"Wrote {args.packets} packets to {args.output}")
+
+
+if __name__ == "__main__":
+    main()